@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config as env
+from decouple import Csv, config as env
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -25,9 +25,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = "django-insecure-j=obuxt!hui@&5!k%sm+p3t!f&!%egj)n4cg=1ntm(i_m90=jf"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Off unless asked for: DEBUG=1 in .env for local development
+DEBUG = env("DEBUG", default=False, cast=bool)
 
-ALLOWED_HOSTS = []
+# Without DEBUG, Django answers only these hosts (comma separated)
+ALLOWED_HOSTS = env("ALLOWED_HOSTS", default="localhost,127.0.0.1", cast=Csv())
 
 
 # Application definition
@@ -39,15 +41,15 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
-    "debug_toolbar",
     "rest_framework",
     "drf_spectacular",
     "core",
 ]
 
 MIDDLEWARE = [
+    "core.metrics.MetricsMiddleware",
+    "core.db_router.ReplicaReadMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -56,6 +58,15 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# debug_toolbar instruments every query and template: development only.
+# Production metrics come from core.metrics (/metrics, Prometheus format).
+if DEBUG:
+    INSTALLED_APPS.insert(INSTALLED_APPS.index("rest_framework"), "debug_toolbar")
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("django.middleware.security.SecurityMiddleware") + 1,
+        "debug_toolbar.middleware.DebugToolbarMiddleware",
+    )
+
 ROOT_URLCONF = "CONFIG.urls"
 
 TEMPLATES = [
@@ -90,6 +101,27 @@ DATABASES = {
     }
 }
 
+# Read replicas (core/db_router.py): DB_REPLICA_HOSTS=host[:port],... adds one
+# alias per replica with the primary's name and credentials. Safe requests
+# read from a replica unless the client wrote in the last REPLICA_PIN_SECONDS
+# (cookie REPLICA_PIN_COOKIE). Two aliases on the same server work for local
+# testing; tests mirror the replicas to the primary.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(env("DB_REPLICA_HOSTS", default="", cast=Csv())):
+    host, _, port = replica.partition(":")
+    alias = f"replica_{index + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.db_router.PrimaryReplicaRouter"]
+REPLICA_PIN_COOKIE = "read_primary"
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -113,12 +145,98 @@ AUTH_PASSWORD_VALIDATORS = [
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "core.authentication.CachedJWTAuthentication",
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
 }
 
+# Home timeline (core/timeline.py): max entries kept per user. Fan-out only
+# appends; run `manage.py rebuild_timelines --trim` periodically (cron) to cut
+# timelines back, they grow by the posts received in between.
+TIMELINE_MAX_LENGTH = 800
+
+# Outbox (core/outbox.py): side effects applied by `manage.py outbox_worker`.
+# OUTBOX_EAGER applies them right after commit instead (local dev, no worker).
+OUTBOX_EAGER = env("OUTBOX_EAGER", default=False, cast=bool)
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_WORKER_THREADS = env("OUTBOX_WORKER_THREADS", default=4, cast=int)
+
+# Shared cache (unread counters, profiles). Set REDIS_URL whenever more than
+# one process serves requests: locmem is per process, so invalidations made
+# by one worker would never reach the others.
+REDIS_URL = env("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+
+# Cached unread counter behind /api/notifications/unread_count/
+NOTIFICATION_UNREAD_CACHE_TTL = 60 * 60
+
+# Users behind JWT auth (core/authentication.py), keyed by a revocation stamp
+# that password changes and deactivation replace: one shared cache read per
+# request instead of a SELECT. The local LRU saves that read's payload.
+AUTH_USER_CACHE_TTL = 60 * 5
+AUTH_USER_LOCAL_CACHE_SIZE = 4096
+AUTH_USER_LOCAL_CACHE_TTL = 60
+
+# Cached profile payloads (core/profile_cache.py); stamps make them exact,
+# the TTL only bounds memory
+PROFILE_CACHE_TTL = 60 * 5
+
+# /api/explore/ (core/explore.py): scores halve every EXPLORE_HALF_LIFE_HOURS,
+# refreshed by `manage.py update_explore_scores` (run it every few minutes)
+EXPLORE_HALF_LIFE_HOURS = 24
+EXPLORE_WEIGHTS = {"likes": 1.0, "comments": 3.0}
+EXPLORE_TOP_N = 500
+# Lifetime of the cached top list: with a per-process cache (locmem) web
+# workers never see the command's refresh, they reload from PostScore once
+# it expires. Keep it near the update_explore_scores interval.
+EXPLORE_TOP_CACHE_TTL = 60 * 5
+EXPLORE_MAX_AGE_DAYS = 7
+
+# Serve GET /api/feed/, /api/notifications/ and /api/users/{id}/ with the
+# async views in core/async_views.py. Turn it on with an ASGI server
+# (docker-compose runs gunicorn with uvicorn workers); under WSGI each async
+# view would get its own event loop and only lose time.
+ASYNC_READ_VIEWS = env("ASYNC_READ_VIEWS", default=False, cast=bool)
+
+# Notification push (core/realtime.py): GET /api/notifications/stream/ is a
+# Server-Sent Events stream served with the async views above. "local" only
+# wakes streams of the same process (one node with OUTBOX_EAGER, tests);
+# "redis" goes through REDIS_URL pub/sub, so the outbox worker reaches every
+# web process. A dotted path selects another broker class.
+REALTIME_BROKER = env("REALTIME_BROKER", default="redis" if REDIS_URL else "local")
+# Comment line sent on idle streams; keep it under the proxies' read timeouts
+REALTIME_HEARTBEAT = 25
+# Lifetime of the single-use ?ticket= of POST /api/notifications/stream-ticket/;
+# the cache must be shared (Redis) when tickets and streams hit different nodes
+STREAM_TICKET_TTL = 30
+
+# /api/users/autocomplete/ results per (query, limit), see core/search.py
+AUTOCOMPLETE_CACHE_TTL = 30
+
+# Resized copies of uploads (core/images.py): longest side in px per variant
+IMAGE_VARIANTS = {
+    "post": {"thumb": 150, "feed": 640, "full": 1080},
+    "avatar": {"thumb": 64, "profile": 320},
+}
+IMAGE_WORKER_PROCESSES = env("IMAGE_WORKER_PROCESSES", default=2, cast=int)
+
+# Resumable uploads (core/uploads.py): /api/uploads/ -> PUT chunks -> finalize
+UPLOAD_SESSION_ROOT = os.path.join(BASE_DIR, "media", "upload_sessions")
+UPLOAD_SESSION_TTL = 60 * 60 * 24
+UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
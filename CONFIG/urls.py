@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
+from core.metrics import metrics
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularRedocView,
@@ -27,10 +28,12 @@ urlpatterns = [
     ),
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("metrics", metrics, name="metrics"),
 ]
 
 if settings.DEBUG:
     import debug_toolbar
 
     urlpatterns += [
-        path("__debug__/", include(debug_toolbar.urls)),]
+        path("__debug__/", include(debug_toolbar.urls)),
+    ]
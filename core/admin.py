@@ -1,5 +1,16 @@
 from django.contrib import admin
-from .models import CustomUser, Post, PostLike, Comment, Notification
+from .models import (
+    CustomUser,
+    Post,
+    PostLike,
+    Comment,
+    Notification,
+    TimelineEntry,
+    OutboxEvent,
+    UploadSession,
+    Hashtag,
+    FollowSuggestion,
+)
 
 
 @admin.register(CustomUser)
@@ -25,3 +36,32 @@ class NotificationAdmin(admin.ModelAdmin):
 @admin.register(PostLike)
 class PostLikeAdmin(admin.ModelAdmin):
     list_display = ("user", "post")
+
+
+@admin.register(TimelineEntry)
+class TimelineEntryAdmin(admin.ModelAdmin):
+    list_display = ("user", "post", "author", "created_at")
+    raw_id_fields = ("user", "post", "author")
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ("kind", "created_at", "processed_at", "attempts")
+    list_filter = ("kind",)
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "filename", "offset", "size", "expires_at")
+
+
+@admin.register(Hashtag)
+class HashtagAdmin(admin.ModelAdmin):
+    list_display = ("name", "posts_count", "created_at")
+    search_fields = ("name",)
+
+
+@admin.register(FollowSuggestion)
+class FollowSuggestionAdmin(admin.ModelAdmin):
+    list_display = ("user", "suggested", "mutuals", "score", "created_at")
+    raw_id_fields = ("user", "suggested")
@@ -0,0 +1,290 @@
+import functools
+import time
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import path
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    NotAuthenticated,
+    NotFound,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from .authentication import CachedJWTAuthentication, redeem_stream_ticket
+from .db_router import use_primary
+from .models import CustomUser
+from .pagination import NotificationSincePagination
+from .relations import get_viewer_relations
+from .views import CustomUserViewSet, FeedAPIView, NotificationViewSet
+from .notifications import unread_count
+from . import profile_cache, realtime
+
+# Async (ASGI) versions of the read-heavy endpoints. They reuse the viewsets'
+# querysets, paginators and serializers, but read through the async ORM, so
+# a worker keeps serving other clients while one waits on the database.
+# Enabled with ASYNC_READ_VIEWS (core/urls.py puts these paths first); every
+# other method on the same paths still goes to the sync viewset.
+# notifications/stream/ pushes new notifications (core/realtime.py) as
+# Server-Sent Events; it only exists here, a sync worker could not hold it.
+
+jwt = CachedJWTAuthentication()
+renderer = JSONRenderer()
+
+# Notification rows read per query by the push stream
+STREAM_BATCH_SIZE = 50
+
+
+def render(data, status=200):
+    return HttpResponse(
+        renderer.render(data), status=status, content_type="application/json"
+    )
+
+
+def error_response(exc):
+    data = (
+        exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+    )
+    response = render(data, exc.status_code)
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        response["WWW-Authenticate"] = jwt.authenticate_header(None)
+    return response
+
+
+async def authenticate(request):
+    """
+    CachedJWTAuthentication.authenticate for the async views;
+    returns (user, validated token), or (AnonymousUser, None) without a header.
+    """
+    header = jwt.get_header(request)
+    if header is None:
+        return AnonymousUser(), None
+    raw_token = jwt.get_raw_token(header)
+    if raw_token is None:
+        return AnonymousUser(), None
+    return await authenticate_token(raw_token)
+
+
+async def authenticate_token(raw_token):
+    token = jwt.get_validated_token(raw_token)
+    # A cache read, or the SELECT on a miss
+    user = await sync_to_async(jwt.get_user)(token)
+    return user, token
+
+
+async def authenticate_ticket(ticket):
+    """(user, claims of the token that issued ``ticket``); see issue_stream_ticket."""
+    claims = await sync_to_async(redeem_stream_ticket)(ticket)
+    if claims is None:
+        raise AuthenticationFailed("Ticket jaraqsiz yamasa waqti otken")
+    # Still checks is_active and the password hash claim
+    user = await sync_to_async(jwt.get_user)(claims)
+    return user, claims
+
+
+def async_api_view(viewset, actions):
+    """
+    Serve GET with the decorated coroutine, anything else with the sync
+    viewset (``actions`` is the router's method -> action mapping).
+    """
+    fallback = sync_to_async(viewset.as_view(actions))
+
+    def decorate(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != "GET":
+                return await fallback(request, *args, **kwargs)
+            drf_request = Request(request)
+            try:
+                drf_request.user, drf_request.auth = await authenticate(request)
+                response = await view(drf_request, *args, **kwargs)
+            except APIException as exc:
+                return error_response(exc)
+            if not isinstance(response, Response):
+                return response
+            return render(response.data, response.status_code)
+
+        wrapper.csrf_exempt = True
+        wrapper.metrics_view = (viewset, actions)
+        return wrapper
+
+    return decorate
+
+
+def viewset_for(cls, action, request, **kwargs):
+    return cls(
+        request=request, args=(), kwargs=kwargs, format_kwarg=None, action=action
+    )
+
+
+@async_api_view(FeedAPIView, {"get": "list"})
+async def feed(request):
+    if not request.user.is_authenticated:
+        raise NotAuthenticated()
+    view = viewset_for(FeedAPIView, "list", request)
+    entries = await view.paginator.apaginate_queryset(
+        view.get_queryset(), request, view
+    )
+    posts = [entry.post for entry in entries]
+    await get_viewer_relations({"request": request}).aload_likes(
+        [post.id for post in posts]
+    )
+    serializer = view.get_serializer(posts, many=True)
+    return view.paginator.get_paginated_response(serializer.data)
+
+
+@async_api_view(NotificationViewSet, {"get": "list"})
+async def notifications(request):
+    if not request.user.is_authenticated:
+        raise NotAuthenticated()
+    view = viewset_for(NotificationViewSet, "list", request)
+    page = await view.paginator.apaginate_queryset(view.get_queryset(), request, view)
+    serializer = view.get_serializer(page, many=True)
+    return view.paginator.get_paginated_response(serializer.data)
+
+
+def sse(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {renderer.render(data).decode()}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_position(request, queryset):
+    """
+    Where the stream starts: after the Last-Event-ID of a reconnecting
+    EventSource, after a ``?since=`` cursor, or after the newest row. Event
+    ids are /since/ cursors, so a client reopening the stream with a new
+    ticket passes its last event id as ``since``. Not a bare notification
+    id, for the reason NotificationSincePagination gives.
+    """
+    paginator = NotificationSincePagination()
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id:
+        return paginator.parse_cursor(last_event_id)[0]
+    position, _ = paginator.decode_cursor(request)
+    if position is None:
+        return await queryset.values_list("created_at", "id").afirst()
+    return position
+
+
+def release_connection():
+    """
+    Close this thread's database connection unless a transaction still
+    needs it; the next query opens a new one.
+    """
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+async def notification_events(request, view, position):
+    """
+    Rows newer than ``position`` (oldest first, as /since/ returns them) each
+    time the user's subscription wakes up, then the unread count if it moved.
+    The stream keeps its request thread but not a database connection while
+    it waits, so idle clients do not use up the server's connections.
+    """
+    paginator = NotificationSincePagination()
+    # Ends with the access token. Reconnects send Last-Event-ID; a ticket
+    # works once, so browsers reopen with a new one and ?since=<last event id>
+    expires_at = request.auth["exp"]
+    unread = None
+    with realtime.subscribe(request.user.id) as subscription:
+        while True:
+            while True:
+                queryset = paginator.cursor_queryset(
+                    view.get_queryset(), position, reverse=False
+                )
+                rows = [row async for row in queryset[:STREAM_BATCH_SIZE]]
+                for row in rows:
+                    position = (row.created_at, row.id)
+                    yield sse(
+                        "notification",
+                        view.get_serializer(row).data,
+                        paginator.make_cursor(row),
+                    )
+                if len(rows) < STREAM_BATCH_SIZE:
+                    break
+
+            count = await sync_to_async(unread_count)(request.user.id)
+            if count != unread:
+                unread = count
+                yield sse("unread_count", {"unread_count": count})
+
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                return
+            # Runs on the request thread, where the async ORM opened it
+            await sync_to_async(release_connection)()
+            if not await subscription.wait(min(settings.REALTIME_HEARTBEAT, remaining)):
+                yield ": heartbeat\n\n"
+
+
+@async_api_view(NotificationViewSet, {"get": "stream"})
+async def notification_stream(request):
+    # EventSource cannot set headers. Browsers pass ?ticket= from
+    # stream-ticket/ instead of the JWT, which would stay valid in every log
+    # the URL reaches; the cost is one POST before each (re)connect, and
+    # tickets need the shared cache. Other clients send Authorization.
+    ticket = request.query_params.get("ticket")
+    if not request.user.is_authenticated and ticket:
+        request.user, request.auth = await authenticate_ticket(ticket)
+    if not request.user.is_authenticated:
+        raise NotAuthenticated()
+    # Pushes follow commits on the primary; a lagging replica would miss rows
+    use_primary()
+    view = viewset_for(NotificationViewSet, "list", request)
+    position = await stream_position(request, view.get_queryset())
+
+    response = StreamingHttpResponse(
+        notification_events(request, view, position),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # Tells nginx not to buffer the events
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@async_api_view(
+    CustomUserViewSet,
+    {
+        "get": "retrieve",
+        "put": "update",
+        "patch": "partial_update",
+        "delete": "destroy",
+    },
+)
+async def profile(request, pk):
+    # CustomUserViewSet.retrieve: cached payload, is_following per viewer
+    view = viewset_for(CustomUserViewSet, "retrieve", request, pk=pk)
+    relations = get_viewer_relations({"request": request})
+    await relations.aload_following([pk])
+
+    host = request.get_host()
+    data, version = await sync_to_async(profile_cache.get_payload)(pk, host)
+    if data is None:
+        use_primary()
+        user = await view.get_queryset().filter(pk=pk).afirst()
+        if user is None:
+            raise NotFound(
+                f"No {CustomUser._meta.object_name} matches the given query."
+            )
+        data = view.get_serializer(user).data
+        await sync_to_async(profile_cache.set_payload)(pk, version, host, data)
+
+    data = {**data, "is_following": relations.is_following(CustomUser(id=pk))}
+    return Response(data)
+
+
+urlpatterns = [
+    path("feed/", feed, name="feed-async"),
+    path("notifications/", notifications, name="notification-async"),
+    path("notifications/stream/", notification_stream, name="notification-stream"),
+    path("users/<int:pk>/", profile, name="user-async"),
+]
@@ -0,0 +1,189 @@
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .db_router import PRIMARY
+from .models import CustomUser
+
+# Written with update() (counters.bump, images.refresh_variants), which sends
+# no signal: left deferred, so a cached user never serves them stale and
+# request.user.save() never writes old values back.
+UNCACHED_FIELDS = {
+    "avatar_variants",
+    "avatar_width",
+    "avatar_height",
+    "avatar_size",
+    "avatar_color",
+    "avatar_placeholder",
+    "posts_count",
+    "followers_count",
+    "following_count",
+}
+CACHED_FIELDS = [
+    field.attname
+    for field in CustomUser._meta.concrete_fields
+    if field.attname not in UNCACHED_FIELDS
+]
+
+
+def stamp_key(user_id):
+    return f"auth:stamp:{user_id}"
+
+
+def user_key(user_id, stamp):
+    return f"auth:user:{user_id}:{stamp}"
+
+
+def ticket_key(ticket):
+    return f"auth:stream-ticket:{ticket}"
+
+
+def get_stamp(user_id):
+    """Revocation stamp: random like profile_cache's, replaced by revoke()."""
+    key = stamp_key(user_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def revoke(user_ids):
+    """Drop the cached rows of these users in every process once this commits."""
+    keys = [stamp_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def issue_stream_ticket(validated_token):
+    """
+    Single-use ticket standing in for ``validated_token`` on the notification
+    stream, valid STREAM_TICKET_TTL seconds. EventSource cannot send headers
+    and a URL ends up in access logs, so the URL carries this, not the JWT.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(
+        ticket_key(ticket), dict(validated_token.payload), settings.STREAM_TICKET_TTL
+    )
+    return ticket
+
+
+def redeem_stream_ticket(ticket):
+    """The claims of the token the ticket was issued for, or None; works once."""
+    key = ticket_key(ticket)
+    claims = cache.get(key)
+    # delete() is true for one caller only, so a replayed ticket loses the race
+    if claims is None or not cache.delete(key):
+        return None
+    return claims
+
+
+class LocalCache:
+    """Small thread-safe LRU with a TTL, for the rows of this process."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_users = LocalCache(
+    settings.AUTH_USER_LOCAL_CACHE_SIZE, settings.AUTH_USER_LOCAL_CACHE_TTL
+)
+
+
+def cached_user_values(user_id):
+    """
+    CACHED_FIELDS of the user, or None. Keyed by the revocation stamp, so one
+    shared cache read per request replaces the SELECT and a revoked row is
+    never served, not even from the local LRU.
+    """
+    stamp = get_stamp(user_id)
+    key = user_key(user_id, stamp)
+    values = local_users.get(key)
+    if values is not None:
+        return values
+    values = cache.get(key)
+    if values is None:
+        # The primary: a lagging replica could bring a revoked row back
+        values = (
+            CustomUser.objects.using(PRIMARY)
+            .filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values_list(*CACHED_FIELDS)
+            .first()
+        )
+        if values is None:
+            return None
+        cache.set(key, values, settings.AUTH_USER_CACHE_TTL)
+    local_users.set(key, values)
+    return values
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user SELECT. request.user is a
+    fresh instance each time, with the UNCACHED_FIELDS loaded on first use.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                "Token contained no recognizable user identification"
+            ) from e
+
+        values = cached_user_values(user_id)
+        if values is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        user = CustomUser.from_db(PRIMARY, CACHED_FIELDS, values)
+
+        # Same checks as JWTAuthentication.get_user
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    "The user's password has been changed.", code="password_changed"
+                )
+        return user
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    # OpenAPI: the same bearer scheme as JWTAuthentication
+    target_class = CachedJWTAuthentication
@@ -0,0 +1,75 @@
+from django.db.models import Case, Count, F, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce
+from .models import (
+    Comment,
+    CustomUser,
+    Hashtag,
+    Notification,
+    Post,
+    PostHashtag,
+    PostLike,
+)
+from . import profile_cache
+
+Follow = CustomUser.followers.through
+Like = PostLike
+
+
+def bump(model, pks, values=None, **deltas):
+    """
+    Atomically add deltas to counter columns, e.g. bump(Post, [1], likes_count=1).
+    ``values`` are plain assignments made by the same UPDATE.
+    """
+    if not pks:
+        return
+    model.objects.filter(pk__in=pks).update(
+        **{field: F(field) + delta for field, delta in deltas.items()},
+        **(values or {}),
+    )
+    if model is CustomUser:
+        profile_cache.invalidate(pks)
+
+
+def _count(model, field, outer="pk", exclude=None):
+    rows = model.objects.filter(**{field: OuterRef(outer)})
+    if exclude:
+        rows = rows.exclude(**exclude)
+    rows = rows.order_by().values(field).annotate(total=Count("*")).values("total")
+    return Coalesce(Subquery(rows), 0)
+
+
+def exact_counts(model):
+    """Counter column -> expression computing its true value from the source tables."""
+    if model is Hashtag:
+        return {"posts_count": _count(PostHashtag, "hashtag_id")}
+    if model is Notification:
+        # Actors behind a coalesced row: the post's likers but the receiver,
+        # or the receiver's followers. Comment rows keep their own value.
+        return {
+            "actors_count": Case(
+                When(
+                    type="like",
+                    then=_count(
+                        Like,
+                        "post_id",
+                        "post_id",
+                        exclude={"user_id": OuterRef("receiver_id")},
+                    ),
+                ),
+                When(
+                    type="follow",
+                    then=_count(Follow, "from_customuser_id", "receiver_id"),
+                ),
+                default=F("actors_count"),
+            )
+        }
+    if model is Post:
+        return {
+            "likes_count": _count(Like, "post_id"),
+            "comments_count": _count(Comment, "post_id"),
+        }
+    return {
+        "posts_count": _count(Post, "author_id"),
+        "followers_count": _count(Follow, "from_customuser_id"),
+        "following_count": _count(Follow, "to_customuser_id"),
+    }
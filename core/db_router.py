@@ -0,0 +1,122 @@
+import random
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Safe requests read from a replica; everything else (writes, requests that
+# wrote, management commands, the outbox worker, the SSE stream once its view
+# has returned) uses the primary. Replicas lag, so a client that wrote is
+# pinned to the primary for REPLICA_PIN_SECONDS through a cookie and reads
+# its own likes, comments and follows back.
+
+PRIMARY = "default"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReadState:
+    """The database choice of one request; shared with sync_to_async threads."""
+
+    __slots__ = ("replica", "wrote")
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+_current = ContextVar("db_read_state", default=None)
+
+
+def replica_aliases():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def use_primary():
+    """Send the remaining reads of the current request to the primary."""
+    state = _current.get()
+    if state is not None:
+        state.replica = None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or state.replica is None:
+            return PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        # Explicit: with None Django would save an instance read from a
+        # replica back to that replica
+        state = _current.get()
+        if state is not None:
+            # Later reads of this request must see the write
+            state.wrote = True
+            state.replica = None
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {PRIMARY, *replica_aliases()}
+        return obj1._state.db in aliases and obj2._state.db in aliases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        return db not in replica_aliases()
+
+
+class ReplicaReadMiddleware:
+    """
+    Chooses the database of each request for PrimaryReplicaRouter and pins
+    clients that wrote to the primary. Runs natively under WSGI and ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.read_state(request)
+        token = _current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        state = self.read_state(request)
+        token = _current.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.pin(request, response, state)
+
+    def read_state(self, request):
+        replicas = replica_aliases()
+        if (
+            not replicas
+            or request.method not in SAFE_METHODS
+            or settings.REPLICA_PIN_COOKIE in request.COOKIES
+        ):
+            return ReadState(None)
+        # One replica per request, so a page and its count agree
+        return ReadState(random.choice(replicas))
+
+    def pin(self, request, response, state):
+        # Unsafe methods count even without ORM writes (raw SQL in core/likes.py)
+        wrote = state.wrote or request.method not in SAFE_METHODS
+        if wrote and response.status_code < 400 and replica_aliases():
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
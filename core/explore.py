@@ -0,0 +1,145 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+from .models import Comment, Post, PostLike, PostScore
+
+# Scores are log(sum(weight * 2 ** (hours since EPOCH / half-life))). Each
+# event keeps its weight at the time it was seen, and ordering by the stored
+# value equals ordering by the decayed score at any later moment. Posts that
+# lost likes or comments are summed again from their rows (rebuild).
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+TOP_KEY = "explore:top"
+BATCH_SIZE = 1000
+# Re-read a little before the last run: engagement committed late still counts
+OVERLAP = timedelta(minutes=5)
+
+
+def growth_rate():
+    return math.log(2) / (settings.EXPLORE_HALF_LIFE_HOURS * 3600)
+
+
+def log_weight(amount, at):
+    return math.log(amount) + (at - EPOCH).total_seconds() * growth_rate()
+
+
+def add(score, value):
+    if score is None:
+        return value
+    high, low = max(score, value), min(score, value)
+    return high + math.log1p(math.exp(low - high))
+
+
+def rescore(score, deltas, at):
+    for kind, delta in deltas.items():
+        if delta > 0:
+            score = add(score, log_weight(delta * settings.EXPLORE_WEIGHTS[kind], at))
+    return score
+
+
+def rebuild(post_ids):
+    """
+    Scores of ``post_ids`` summed again from their likes and comments, each at
+    the weight of its own created_at. An unlike cannot be subtracted: which
+    weight the like went in with is not stored, and the current one is larger.
+    """
+    scores = dict.fromkeys(post_ids)
+    for kind, model in (("likes", PostLike), ("comments", Comment)):
+        events = model.objects.filter(post_id__in=post_ids).values_list(
+            "post_id", "created_at"
+        )
+        for post_id, created_at in events.iterator():
+            value = log_weight(settings.EXPLORE_WEIGHTS[kind], created_at)
+            scores[post_id] = add(scores[post_id], value)
+    return scores
+
+
+def last_run():
+    return PostScore.objects.aggregate(last=Max("scored_at"))["last"]
+
+
+def update_scores(since=None, batch_size=BATCH_SIZE):
+    """
+    Fold the engagement of posts touched after ``since`` (default: the last
+    run) into their scores. Counters seen last time are stored per post, so
+    only the difference is added and overlapping runs are harmless.
+    Returns the number of posts rescored.
+    """
+    now = timezone.now()
+    since = since or last_run()
+    cutoff = now - timedelta(days=settings.EXPLORE_MAX_AGE_DAYS)
+    posts = Post.objects.filter(
+        engaged_at__isnull=False, created_at__gte=cutoff
+    ).order_by("pk")
+    if since is not None:
+        posts = posts.filter(engaged_at__gte=since - OVERLAP)
+    posts = posts.values_list("pk", "likes_count", "comments_count")
+
+    done = 0
+    last_pk = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return done
+        last_pk = batch[-1][0]
+        scores = PostScore.objects.in_bulk([pk for pk, _, _ in batch])
+        shrunk = rebuild(
+            [
+                pk
+                for pk, likes, comments in batch
+                if pk in scores
+                and (
+                    likes < scores[pk].likes_seen or comments < scores[pk].comments_seen
+                )
+            ]
+        )
+
+        created, updated = [], []
+        for pk, likes, comments in batch:
+            row = scores.get(pk)
+            if row is None:
+                row = PostScore(post_id=pk)
+                created.append(row)
+            else:
+                updated.append(row)
+            deltas = {
+                "likes": likes - row.likes_seen,
+                "comments": comments - row.comments_seen,
+            }
+            if pk in shrunk:
+                row.score = shrunk[pk]
+            else:
+                row.score = rescore(row.score, deltas, now)
+            row.likes_seen, row.comments_seen, row.scored_at = likes, comments, now
+
+        PostScore.objects.bulk_create(created)
+        PostScore.objects.bulk_update(
+            updated, ["score", "likes_seen", "comments_seen", "scored_at"]
+        )
+        done += len(batch)
+
+
+def prune():
+    """Drop the scores of posts too old for explore."""
+    cutoff = timezone.now() - timedelta(days=settings.EXPLORE_MAX_AGE_DAYS)
+    return PostScore.objects.filter(post__created_at__lt=cutoff).delete()[0]
+
+
+def refresh_top():
+    """Cache the ids of the EXPLORE_TOP_N best posts for EXPLORE_TOP_CACHE_TTL."""
+    ids = list(
+        PostScore.objects.filter(score__isnull=False)
+        .order_by("-score")
+        .values_list("post_id", flat=True)[: settings.EXPLORE_TOP_N]
+    )
+    cache.set(TOP_KEY, ids, settings.EXPLORE_TOP_CACHE_TTL)
+    return ids
+
+
+def top_ids():
+    ids = cache.get(TOP_KEY)
+    if ids is None:
+        ids = refresh_top()
+    return ids
@@ -0,0 +1,104 @@
+import re
+from collections import defaultdict
+from django.db import transaction
+from .counters import bump
+from .models import Hashtag, Post, PostHashtag
+
+MAX_NAME_LENGTH = Hashtag._meta.get_field("name").max_length
+TAG_RE = re.compile(rf"#(\w{{1,{MAX_NAME_LENGTH}}})")
+MAX_TAGS_PER_POST = 30
+
+
+def extract(caption):
+    """Normalized (casefolded) tag names in a caption, first MAX_TAGS_PER_POST."""
+    names = dict.fromkeys(
+        name
+        for name in (tag.casefold() for tag in TAG_RE.findall(caption or ""))
+        # casefold() can grow a name ("ß" -> "ss"): skip what no longer fits
+        if len(name) <= MAX_NAME_LENGTH
+    )
+    return set(list(names)[:MAX_TAGS_PER_POST])
+
+
+def hashtag_ids(names):
+    """name -> id, creating the missing Hashtag rows."""
+    if not names:
+        return {}
+    Hashtag.objects.bulk_create(
+        [Hashtag(name=name) for name in names], ignore_conflicts=True
+    )
+    return dict(Hashtag.objects.filter(name__in=names).values_list("name", "id"))
+
+
+def sync_posts(posts):
+    """
+    Bring the PostHashtag rows of ``posts`` in line with their captions using
+    a fixed number of set queries, and move posts_count by the difference.
+    """
+    with transaction.atomic():
+        _lock(post.pk for post in posts)
+        _sync_posts(posts)
+
+
+def _lock(post_ids):
+    # Concurrent syncs of one post would both see the same rows missing and
+    # both count them; locking the posts makes the diff below exact
+    list(
+        Post.objects.select_for_update()
+        .filter(pk__in=list(post_ids))
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def _sync_posts(posts):
+    wanted = {post.pk: extract(post.caption) for post in posts}
+    created_at = {post.pk: post.created_at for post in posts}
+
+    current = defaultdict(dict)
+    rows = PostHashtag.objects.filter(post_id__in=wanted).values_list(
+        "id", "post_id", "hashtag__name", "hashtag_id"
+    )
+    for row_id, post_id, name, hashtag_id in rows:
+        current[post_id][name] = (row_id, hashtag_id)
+
+    ids = hashtag_ids(set().union(*wanted.values()))
+    added, removed = [], []
+    for post_id, names in wanted.items():
+        for name in names - current[post_id].keys():
+            added.append(
+                PostHashtag(
+                    post_id=post_id,
+                    hashtag_id=ids[name],
+                    created_at=created_at[post_id],
+                )
+            )
+        for name in current[post_id].keys() - names:
+            removed.append(current[post_id][name])
+
+    if added:
+        PostHashtag.objects.bulk_create(added, ignore_conflicts=True)
+    if removed:
+        PostHashtag.objects.filter(id__in=[row_id for row_id, _ in removed]).delete()
+
+    deltas = defaultdict(int)
+    for row in added:
+        deltas[row.hashtag_id] += 1
+    for _, hashtag_id in removed:
+        deltas[hashtag_id] -= 1
+    by_delta = defaultdict(list)
+    for hashtag_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(hashtag_id)
+    for delta, tag_ids in by_delta.items():
+        bump(Hashtag, tag_ids, posts_count=delta)
+
+
+def forget_post(post):
+    """Decrement the tags of a post that is about to be deleted."""
+    # A concurrent delete of the same post waits here, then finds no rows
+    _lock([post.pk])
+    ids = list(
+        PostHashtag.objects.filter(post_id=post.pk).values_list("hashtag_id", flat=True)
+    )
+    bump(Hashtag, ids, posts_count=-1)
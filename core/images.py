@@ -0,0 +1,175 @@
+import base64
+import io
+import multiprocessing
+import os
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# No model imports here: pool processes import this module without Django set up
+
+FORMATS = {"jpeg": ("JPEG", "jpg"), "webp": ("WEBP", "webp")}
+
+# kind -> image field; metadata lives in <field>_variants, <field>_width, ...
+IMAGE_FIELDS = {"post": "image", "avatar": "avatar"}
+
+# <field>_<key> columns filled from describe_bytes()
+METADATA_KEYS = ("width", "height", "size", "color", "placeholder")
+
+PLACEHOLDER_SIZE = 16
+ORIENTATION_TAG = 0x0112
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, "IMAGE_WORKER_PROCESSES", None),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _pool
+
+
+def _decode(data):
+    image = Image.open(io.BytesIO(data))
+    return ImageOps.exif_transpose(image).convert("RGB")
+
+
+def describe(image):
+    """Size, dominant color and a tiny inline WebP placeholder (LQIP) of an RGB image."""
+    small = image.copy()
+    small.thumbnail((64, 64))
+    palette = small.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    _, index = max(palette.getcolors())
+    red, green, blue = palette.getpalette()[index * 3 : index * 3 + 3]
+
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = io.BytesIO()
+    small.save(buffer, "WEBP", quality=30)
+    placeholder = base64.b64encode(buffer.getvalue()).decode()
+
+    return {
+        "width": image.width,
+        "height": image.height,
+        "color": f"#{red:02x}{green:02x}{blue:02x}",
+        "placeholder": f"data:image/webp;base64,{placeholder}",
+    }
+
+
+def describe_bytes(data):
+    """Metadata only, for backfills. Runs in the pool."""
+    return {**describe(_decode(data)), "size": len(data)}
+
+
+def synthetic(width, height, seed):
+    """A random JPEG (color blocks over a plain background) for seed data. Runs in the pool."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), tuple(rng.choices(range(256), k=3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(3, 12)):
+        x, y = rng.randrange(width), rng.randrange(height)
+        box = (x, y, x + rng.randint(20, width // 2), y + rng.randint(20, height // 2))
+        draw.ellipse(box, fill=tuple(rng.choices(range(256), k=3)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def render_variants(data, sizes):
+    """
+    Decode the upload once, describe it, then encode every size as JPEG and
+    WebP, largest first, so each step downscales the previous result.
+    Runs in the pool; returns (metadata, {variant: {format: bytes}}).
+    """
+    image = _decode(data)
+    meta = {**describe(image), "size": len(data)}
+
+    rendered = {}
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        rendered[name] = {}
+        for fmt, (pil_format, _) in FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, quality=82)
+            rendered[name][fmt] = buffer.getvalue()
+    return meta, rendered
+
+
+def save_variants(source, rendered):
+    stem = os.path.splitext(source)[0]
+    variants = {"source": source}
+    for name, encodings in rendered.items():
+        variants[name] = {}
+        for fmt, content in encodings.items():
+            path = f"variants/{stem}_{name}.{FORMATS[fmt][1]}"
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[name][fmt] = default_storage.save(path, ContentFile(content))
+    return variants
+
+
+def needs_variants(field_file, variants):
+    return (variants or {}).get("source") != (field_file.name or None)
+
+
+def upload_dimensions(field_file):
+    """
+    Width, height and byte size of a file that is still being uploaded, read
+    from the upload headers only; None for files already in media storage.
+    """
+    if not field_file or field_file._committed:
+        return None
+    upload = field_file.file
+    upload.seek(0)
+    with Image.open(upload) as image:
+        width, height = image.size
+        if image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+            width, height = height, width
+    upload.seek(0)
+    return {"width": width, "height": height, "size": field_file.size}
+
+
+def refresh_variants(instance, kind, force=False):
+    """Render the variants of instance's image if it changed; True if it did work."""
+    prefix = IMAGE_FIELDS[kind]
+    field_file = getattr(instance, prefix)
+    if not force and not needs_variants(
+        field_file, getattr(instance, f"{prefix}_variants")
+    ):
+        return False
+
+    values = {"variants": {}, "width": None, "height": None, "size": None}
+    values.update(color="", placeholder="")
+    if field_file:
+        with field_file.open("rb") as source:
+            data = source.read()
+        sizes = settings.IMAGE_VARIANTS[kind]
+        meta, rendered = get_pool().submit(render_variants, data, sizes).result()
+        values.update(meta, variants=save_variants(field_file.name, rendered))
+
+    values = {f"{prefix}_{key}": value for key, value in values.items()}
+    # update() skips post_save, so this does not queue the same work again
+    type(instance).objects.filter(pk=instance.pk).update(**values)
+    for field, value in values.items():
+        setattr(instance, field, value)
+    return True
+
+
+def variant_urls(variants, request=None):
+    urls = {}
+    for name, encodings in (variants or {}).items():
+        if name == "source":
+            continue
+        urls[name] = {}
+        for fmt, path in encodings.items():
+            url = default_storage.url(path)
+            urls[name][fmt] = request.build_absolute_uri(url) if request else url
+    return urls
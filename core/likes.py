@@ -0,0 +1,80 @@
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404
+from django.utils import timezone
+from .counters import bump
+from .models import Post, PostLike
+from .outbox import enqueue
+
+# One round trip: delete the like if it exists, otherwise insert it, and move
+# the counter by the difference. Every part of a data-modifying CTE sees the
+# same snapshot, so "inserted" only runs when "deleted" removed nothing.
+TOGGLE_SQL = """
+WITH deleted AS (
+    DELETE FROM {like} WHERE post_id = %(post)s AND user_id = %(user)s
+    RETURNING 1
+), inserted AS (
+    INSERT INTO {like} (post_id, user_id, created_at)
+    SELECT %(post)s, %(user)s, %(now)s WHERE NOT EXISTS (SELECT 1 FROM deleted)
+    ON CONFLICT (user_id, post_id) DO NOTHING
+    RETURNING 1
+)
+UPDATE {post}
+SET likes_count = likes_count
+        + (SELECT COUNT(*) FROM inserted) - (SELECT COUNT(*) FROM deleted),
+    engaged_at = %(now)s
+WHERE id = %(post)s
+RETURNING (SELECT COUNT(*) FROM inserted) > 0, likes_count
+"""
+
+
+def toggle_like(post_id, user_id):
+    """
+    Like the post, or unlike it if already liked. Returns (liked, likes_count).
+    Writes the row directly, so m2m_changed does not fire: the counter and the
+    outbox event are handled here.
+    """
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            liked, likes_count = _toggle_postgres(post_id, user_id)
+        else:
+            liked, likes_count = _toggle_orm(post_id, user_id)
+        if liked:
+            enqueue("like", pairs=[[post_id, user_id]])
+    return liked, likes_count
+
+
+def _toggle_postgres(post_id, user_id):
+    sql = TOGGLE_SQL.format(
+        like=connection.ops.quote_name(PostLike._meta.db_table),
+        post=connection.ops.quote_name(Post._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"post": post_id, "user": user_id, "now": timezone.now()})
+        row = cursor.fetchone()
+    if row is None:
+        # Post deleted since the view looked it up; the atomic block rolls
+        # back the like inserted for it (its foreign key is deferred)
+        raise Http404
+    return row
+
+
+def _toggle_orm(post_id, user_id):
+    # Backends without data-modifying CTEs (SQLite in development)
+    deleted = PostLike.objects.filter(post_id=post_id, user_id=user_id).delete()[0]
+    inserted = 0
+    if not deleted:
+        try:
+            with transaction.atomic():
+                PostLike.objects.create(post_id=post_id, user_id=user_id)
+            inserted = 1
+        except IntegrityError:
+            pass
+    bump(
+        Post, [post_id], {"engaged_at": timezone.now()}, likes_count=inserted - deleted
+    )
+    likes_count = (
+        Post.objects.filter(pk=post_id).values_list("likes_count", flat=True).first()
+    )
+    if likes_count is None:
+        raise Http404
+    return bool(inserted), likes_count
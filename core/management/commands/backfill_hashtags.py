@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core import hashtags
+from core.counters import exact_counts
+from core.models import Hashtag, Post
+
+
+class Command(BaseCommand):
+    help = "Bar postlardin caption larinan hashtaglardi ajiratip alip saqlaw"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.only("id", "caption", "created_at").order_by("pk")
+        done = 0
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[: options["batch_size"]])
+            if not batch:
+                break
+            with transaction.atomic():
+                hashtags.sync_posts(batch)
+            last_pk = batch[-1].pk
+            done += len(batch)
+            self.stdout.write(f" {last_pk} ge shekem {done} post islendi...")
+
+        # Exact counts, so re-running after a partial run never double counts
+        fixed = Hashtag.objects.update(**exact_counts(Hashtag))
+        self.stdout.write(self.style.SUCCESS(f"{done} post, {fixed} hashtag tayar!"))
@@ -0,0 +1,341 @@
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import numpy as np
+from prometheus_client.parser import text_string_to_metric_families
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.utils import timezone
+from core.models import CustomUser, Post
+
+# name -> (share of the mix, method, path, metrics view label)
+ENDPOINTS = {
+    "feed": (40, "GET", "/api/feed/", "FeedAPIView.list"),
+    "profile": (20, "GET", "/api/users/{user}/", "CustomUserViewSet.retrieve"),
+    "notifications": (15, "GET", "/api/notifications/", "NotificationViewSet.list"),
+    "like": (15, "POST", "/api/posts/{post}/like/", "PostViewSet.like"),
+    "comment": (10, "POST", "/api/posts/{post}/comment/", "PostViewSet.comment"),
+}
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+PERCENTILES = (50, 95, 99)
+
+
+class InProcess:
+    """Requests through django.test.Client, one per thread."""
+
+    def __init__(self, host):
+        self.host = host
+        self.local = threading.local()
+
+    def request(self, method, path, token=None, body=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = Client(HTTP_HOST=self.host)
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        if method == "GET":
+            response = client.get(path, **headers)
+        else:
+            response = client.post(
+                path, json.dumps(body or {}), "application/json", **headers
+            )
+        return response.status_code, response.content
+
+
+class Remote:
+    """Requests to a running server (gunicorn, not nginx: /metrics is denied there)."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.local = threading.local()
+
+    def request(self, method, path, token=None, body=None):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=30
+            )
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        payload = json.dumps(body) if body is not None else None
+        try:
+            conn.request(method, path, payload, headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            # Dropped keep-alive connection: reconnect once
+            conn.close()
+            conn.request(method, path, payload, headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+
+
+class Command(BaseCommand):
+    help = (
+        "Feed, profil, like, kommentariya ham notification endpointlerin juklep "
+        "olshew: p50/p95/p99, RPS, bir sorawga DB queries; baseline menen salistiriw"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--warmup", type=int, default=100)
+        parser.add_argument("--concurrency", type=int, default=1)
+        parser.add_argument(
+            "--base-url",
+            help="Iske tusken server (mis. http://127.0.0.1:8000); bolmasa in-process",
+        )
+        parser.add_argument(
+            "--host", default="localhost", help="In-process Host header"
+        )
+        parser.add_argument(
+            "--users", type=int, default=200, help="Neshe paydalaniwshi atinan soraw"
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--endpoints",
+            nargs="*",
+            choices=list(ENDPOINTS),
+            help="Tek usi endpointler (aralasma ulesi saqlanadi)",
+        )
+        parser.add_argument("--output", help="Natiyjelerdi JSON faylga jaziw")
+        parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Natiyjelerdi jana baseline retinde saqlaw",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=20.0,
+            help="p95 yaki RPS neshe procentke jamanlassa regressiya",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        actors = self.actors(options["users"], rng)
+        post_ids = list(
+            Post.objects.order_by("-created_at", "-id").values_list("id", flat=True)[
+                :1000
+            ]
+        )
+        if not actors or not post_ids:
+            raise CommandError("Baza bos: aldin `manage.py seed` iske tusirin")
+
+        names = options["endpoints"] or list(ENDPOINTS)
+        weights = [ENDPOINTS[name][0] for name in names]
+        user_ids = [user_id for user_id, _ in actors]
+
+        def plan(count):
+            # Drawn up front so every run with the same seed sends the same requests
+            return [
+                (
+                    name,
+                    rng.choice(actors),
+                    {"user": rng.choice(user_ids), "post": rng.choice(post_ids)},
+                )
+                for name in rng.choices(names, weights, k=count)
+            ]
+
+        if options["base_url"]:
+            client = Remote(options["base_url"])
+        else:
+            client = InProcess(options["host"])
+        self.run(client, plan(options["warmup"]), options["concurrency"])
+
+        before = self.scrape(client)
+        timings, wall = self.run(
+            client, plan(options["requests"]), options["concurrency"]
+        )
+        queries = self.queries_per_request(before, self.scrape(client))
+
+        results = {
+            "meta": {
+                "at": timezone.now().isoformat(),
+                "mode": options["base_url"] or "in-process",
+                "database": connection.vendor,
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "seed": options["seed"],
+                "seconds": round(wall, 3),
+                "rps": round(options["requests"] / wall, 1),
+            },
+            "endpoints": {},
+        }
+        for name in names:
+            samples = timings.get(name, [])
+            if not samples:
+                continue
+            latencies = np.array([elapsed for elapsed, _ in samples]) * 1000
+            row = {
+                "requests": len(samples),
+                "errors": sum(1 for _, ok in samples if not ok),
+                "rps": round(len(samples) / wall, 1),
+                "queries": queries.get(ENDPOINTS[name][3]),
+            }
+            for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+                row[f"p{p}_ms"] = round(float(value), 2)
+            results["endpoints"][name] = row
+
+        self.report(results)
+        if options["output"]:
+            self.dump(results, options["output"])
+        regressions = self.compare(results, options["baseline"], options["tolerance"])
+        if options["save_baseline"]:
+            self.dump(results, options["baseline"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Baseline saqlandi: {options['baseline']}")
+            )
+        elif regressions:
+            raise CommandError(
+                f"{len(regressions)} regressiya: {', '.join(regressions)}"
+            )
+
+    def actors(self, count, rng):
+        """(user id, access token) of users with a timeline, so feeds are not empty."""
+        ids = list(
+            CustomUser.objects.filter(is_active=True, following_count__gt=0)
+            .order_by("id")
+            .values_list("id", flat=True)[: count * 10]
+        )
+        ids = sorted(rng.sample(ids, min(count, len(ids))))
+        users = CustomUser.objects.in_bulk(ids)
+        return [(pk, str(RefreshToken.for_user(users[pk]).access_token)) for pk in ids]
+
+    def run(self, client, plan, concurrency):
+        """Send ``plan`` over ``concurrency`` threads; returns ({name: [(seconds, ok)]}, wall time)."""
+        timings = {}
+        lock = threading.Lock()
+        position = iter(range(len(plan)))
+
+        def worker():
+            local = {}
+            while True:
+                with lock:
+                    index = next(position, None)
+                if index is None:
+                    break
+                name, (_, token), targets = plan[index]
+                _, method, path, _ = ENDPOINTS[name]
+                body = None
+                if name == "comment":
+                    body = {"user": targets["user"], "text": "benchmark"}
+                started = time.perf_counter()
+                status, _ = client.request(method, path.format(**targets), token, body)
+                elapsed = time.perf_counter() - started
+                local.setdefault(name, []).append((elapsed, status < 400))
+            with lock:
+                for name, samples in local.items():
+                    timings.setdefault(name, []).extend(samples)
+            # The test client keeps request connections open: drop this thread's
+            connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, time.perf_counter() - started
+
+    def scrape(self, client):
+        """view -> (sum, count) of the DB query histogram from /metrics."""
+        status, body = client.request("GET", "/metrics")
+        if status != 200:
+            return {}
+        totals = {}
+        for family in text_string_to_metric_families(body.decode()):
+            if family.name != "http_request_db_queries":
+                continue
+            for sample in family.samples:
+                view = sample.labels.get("view")
+                total, count = totals.get(view, (0.0, 0.0))
+                if sample.name.endswith("_sum"):
+                    totals[view] = (total + sample.value, count)
+                elif sample.name.endswith("_count"):
+                    totals[view] = (total, count + sample.value)
+        return totals
+
+    def queries_per_request(self, before, after):
+        result = {}
+        for view, (total, count) in after.items():
+            old_total, old_count = before.get(view, (0.0, 0.0))
+            if count > old_count:
+                result[view] = round((total - old_total) / (count - old_count), 2)
+        return result
+
+    def report(self, results):
+        meta = results["meta"]
+        self.stdout.write(
+            f"{meta['requests']} soraw, {meta['seconds']} s, {meta['rps']} RPS "
+            f"({meta['mode']}, {meta['database']}, concurrency {meta['concurrency']})"
+        )
+        self.stdout.write(
+            f"{'endpoint':<14}{'n':>7}{'err':>6}{'rps':>9}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+        )
+        for name, row in results["endpoints"].items():
+            self.stdout.write(
+                f"{name:<14}{row['requests']:>7}{row['errors']:>6}{row['rps']:>9}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+                f"{row['queries'] if row['queries'] is not None else '-':>9}"
+            )
+
+    def compare(self, results, path, tolerance):
+        """Names of the endpoints that got slower or heavier than the baseline."""
+        if not os.path.exists(path):
+            self.stdout.write(f"Baseline joq ({path}), salistiriw otkerip jiberildi")
+            return []
+        with open(path) as f:
+            baseline = json.load(f)
+        for key in ("mode", "database", "concurrency"):
+            if baseline["meta"].get(key) != results["meta"][key]:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Baseline basqasha {key} penen olshengen: "
+                        f"{baseline['meta'].get(key)} != {results['meta'][key]}"
+                    )
+                )
+        baseline = baseline["endpoints"]
+
+        regressions = []
+        limit = 1 + tolerance / 100
+        for name, row in results["endpoints"].items():
+            old = baseline.get(name)
+            if old is None:
+                continue
+            problems = []
+            if row["p95_ms"] > old["p95_ms"] * limit:
+                problems.append(f"p95 {old['p95_ms']} -> {row['p95_ms']} ms")
+            if row["rps"] * limit < old["rps"]:
+                problems.append(f"rps {old['rps']} -> {row['rps']}")
+            # Likes toggle, so the like/unlike mix (and its queries) drifts a little
+            if (
+                row["queries"] is not None
+                and old.get("queries") is not None
+                and row["queries"] > max(old["queries"] * limit, old["queries"] + 1)
+            ):
+                problems.append(f"queries {old['queries']} -> {row['queries']}")
+            if row["errors"] > old.get("errors", 0):
+                problems.append(f"errors {old.get('errors', 0)} -> {row['errors']}")
+            if problems:
+                regressions.append(name)
+                self.stdout.write(
+                    self.style.ERROR(f"REGRESSION {name}: {'; '.join(problems)}")
+                )
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok   {name}"))
+        return regressions
+
+    def dump(self, results, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from core import images
+from core.models import CustomUser, Post
+
+
+class Command(BaseCommand):
+    help = "Bar suwretler ushin olshem, tiykargi ren ham placeholder esaplaw"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=["post", "avatar", "all"], default="all")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--force", action="store_true", help="Bar metadata ni da qayta esaplaw"
+        )
+
+    def handle(self, *args, **options):
+        kinds = ["post", "avatar"] if options["kind"] == "all" else [options["kind"]]
+        for kind in kinds:
+            done = self.backfill(kind, options["batch_size"], options["force"])
+            self.stdout.write(self.style.SUCCESS(f"{kind}: {done} suwret islendi"))
+
+    def backfill(self, kind, batch_size, force):
+        model = Post if kind == "post" else CustomUser
+        prefix = images.IMAGE_FIELDS[kind]
+        queryset = model.objects.exclude(**{prefix: ""}).exclude(
+            **{f"{prefix}__isnull": True}
+        )
+        if not force:
+            queryset = queryset.filter(**{f"{prefix}_color": ""})
+        queryset = queryset.only("pk", prefix).order_by("pk")
+
+        done = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return done
+            last_pk = batch[-1].pk
+            done += self.process(model, batch, prefix)
+            self.stdout.write(f" {kind} {last_pk} ge shekem tekserildi...")
+
+    def process(self, model, batch, prefix):
+        # Read the files here, decode and describe the whole batch in the pool
+        rows, payloads = [], []
+        for instance in batch:
+            field_file = getattr(instance, prefix)
+            try:
+                with field_file.open("rb") as source:
+                    payloads.append(source.read())
+            except OSError as exc:
+                self.stderr.write(f" {prefix} {instance.pk}: {exc}")
+                continue
+            rows.append(instance)
+
+        pool = images.get_pool()
+        futures = [pool.submit(images.describe_bytes, data) for data in payloads]
+        described = []
+        for instance, future in zip(rows, futures):
+            try:
+                meta = future.result()
+            except Exception as exc:
+                self.stderr.write(f" {prefix} {instance.pk}: {exc}")
+                continue
+            for key, value in meta.items():
+                setattr(instance, f"{prefix}_{key}", value)
+            described.append(instance)
+
+        fields = [f"{prefix}_{key}" for key in images.METADATA_KEYS]
+        model.objects.bulk_update(described, fields)
+        return len(described)
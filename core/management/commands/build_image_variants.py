@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core import images
+from core.models import CustomUser, Post
+
+
+class Command(BaseCommand):
+    help = "Bar bolgan post suwretleri ham avatarlar ushin variantlar (thumb, feed, WebP) jaratiw"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=["post", "avatar", "all"], default="all")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--force", action="store_true", help="Bar variantlardi da qayta jaratiw"
+        )
+
+    def handle(self, *args, **options):
+        kinds = ["post", "avatar"] if options["kind"] == "all" else [options["kind"]]
+        threads = settings.IMAGE_WORKER_PROCESSES or 1
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for kind in kinds:
+                done = self.backfill(
+                    pool, kind, options["batch_size"], options["force"]
+                )
+                self.stdout.write(self.style.SUCCESS(f"{kind}: {done} suwret islendi"))
+
+    def backfill(self, pool, kind, batch_size, force):
+        model = Post if kind == "post" else CustomUser
+        file_field = images.IMAGE_FIELDS[kind]
+        queryset = model.objects.exclude(**{file_field: ""}).exclude(
+            **{f"{file_field}__isnull": True}
+        )
+
+        done = 0
+        batch = []
+        for instance in queryset.order_by("pk").iterator(chunk_size=batch_size):
+            batch.append(instance)
+            if len(batch) >= batch_size:
+                done += self.process(pool, batch, kind, force)
+                batch = []
+        if batch:
+            done += self.process(pool, batch, kind, force)
+        return done
+
+    def process(self, pool, batch, kind, force):
+        def refresh(instance):
+            close_old_connections()
+            return images.refresh_variants(instance, kind, force=force)
+
+        done = sum(pool.map(refresh, batch))
+        self.stdout.write(f" {kind} {batch[-1].pk} ge shekem tekserildi...")
+        return done
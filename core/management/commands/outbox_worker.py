@@ -0,0 +1,44 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core import outbox, uploads
+
+
+class Command(BaseCommand):
+    help = "Outbox eventlerin (notification, timeline) fonda islew"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads", type=int, default=settings.OUTBOX_WORKER_THREADS
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--sleep", type=float, default=1.0, help="Event bolmasa neshe sekund kutiw"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Barliq eventlerdi islep toqtaw"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Outbox worker iske tusti ({options['threads']} thread)...")
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            while True:
+                ids = outbox.pending_ids(options["batch_size"])
+                done = sum(pool.map(self.process, ids))
+                if done:
+                    self.stdout.write(f"{done}/{len(ids)} event islendi")
+                    continue
+
+                if options["once"]:
+                    break
+                outbox.purge()
+                uploads.purge_expired()
+                time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS("Outbox worker toqtadi"))
+
+    def process(self, event_id):
+        close_old_connections()
+        return outbox.process_event(event_id)
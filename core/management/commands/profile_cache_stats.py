@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from core import profile_cache
+
+
+class Command(BaseCommand):
+    help = "Profil cache statistikasi (hit / miss)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Sanaqlardi nolge tusiriw"
+        )
+
+    def handle(self, *args, **options):
+        stats = profile_cache.stats()
+        self.stdout.write(
+            f"hits: {stats['hits']}  misses: {stats['misses']}  hit rate: {stats['hit_rate']}"
+        )
+        if options["reset"]:
+            profile_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Sanaqlar nolge tusirildi"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core import uploads
+
+
+class Command(BaseCommand):
+    help = "Waqti otken juklew sessiyalarin ham olardin fayllarin oshiriw"
+
+    def handle(self, *args, **options):
+        deleted = uploads.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} sessiya oshirildi"))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from core import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Home timeline lardi follow baylanislari ham postlardan qaytadan quriw"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, nargs="*", help="Tek usi user id lerdi qayta quriw"
+        )
+        parser.add_argument(
+            "--trim",
+            action="store_true",
+            help="Qayta qurmay, tek TIMELINE_MAX_LENGTH ten artiq jazbalardi oshiriw "
+            "(fan-out qisqartpaydi: muntazam iske tusiriw kerek)",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options["trim"]:
+            # One grouped scan instead of ranking every timeline
+            user_ids = timeline.overflowing()
+            if options["user"]:
+                user_ids = user_ids.filter(user_id__in=options["user"])
+        else:
+            user_ids = User.objects.order_by("id").values_list("id", flat=True)
+            if options["user"]:
+                user_ids = user_ids.filter(id__in=options["user"])
+
+        batch_size = options["batch_size"]
+        batch = []
+        done = 0
+        for user_id in user_ids.iterator(chunk_size=batch_size):
+            batch.append(user_id)
+            if len(batch) >= batch_size:
+                done += self.process(batch, options["trim"])
+                batch = []
+        if batch:
+            done += self.process(batch, options["trim"])
+
+        self.stdout.write(self.style.SUCCESS(f"{done} timeline tayar!"))
+
+    def process(self, user_ids, trim_only):
+        if trim_only:
+            timeline.trim(user_ids)
+        else:
+            for user_id in user_ids:
+                timeline.rebuild(user_id)
+        self.stdout.write(f" {user_ids[-1]} id ge shekem islendi...")
+        return len(user_ids)
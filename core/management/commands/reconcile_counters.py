@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Q
+from core import profile_cache
+from core.counters import exact_counts
+from core.models import CustomUser, Hashtag, Notification, Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Like/comment/follow/post/hashtag ham notification actors sanaqlarin "
+        "haqiyqiy mag'liwmatlar menen salistirip tuzetiw"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        for model in (CustomUser, Post, Hashtag, Notification):
+            fixed = self.reconcile(model, options["batch_size"])
+            self.stdout.write(
+                self.style.SUCCESS(f"{model.__name__}: {fixed} qatar tuzetildi")
+            )
+
+    def reconcile(self, model, batch_size):
+        counts = exact_counts(model)
+        drifted = Q()
+        for field, expression in counts.items():
+            drifted |= ~Q(**{field: expression})
+
+        last_pk = model.objects.aggregate(last=Max("pk"))["last"] or 0
+        fixed = 0
+        for start in range(0, last_pk + 1, batch_size):
+            ids = list(
+                model.objects.filter(pk__gte=start, pk__lt=start + batch_size)
+                .filter(drifted)
+                .values_list("pk", flat=True)
+            )
+            if not ids:
+                continue
+            fixed += model.objects.filter(pk__in=ids).update(**counts)
+            if model is CustomUser:
+                profile_cache.invalidate(ids)
+        return fixed
@@ -1,127 +1,457 @@
-import random
 import io
-from PIL import Image
+import json
+import math
+import time
+from datetime import datetime, timedelta
+import numpy as np
 from faker import Faker
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
 from django.core.files.base import ContentFile
-from django.contrib.auth import get_user_model
-from core.models import Post, Comment
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+from core import hashtags, images
+from core.counters import exact_counts
+from core.models import Comment, CustomUser, Hashtag, Post, PostHashtag, PostLike
+
+Follow = CustomUser.followers.through
+
+PASSWORD = "password123"
+# Escapes of the COPY text format
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+COPY_NULL = "\\N"
+# Faker is slow; rows pick their names and texts from pools this big
+TEXT_POOL_SIZE = 1000
+
+
+def _copy_text(value):
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, str):
+        return value.translate(COPY_ESCAPES)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class Loader:
+    """
+    Writes a table column by column: ``columns`` maps attnames to equally long
+    sequences (numpy arrays or lists), every other column gets ``constants``
+    or its default, prepared once. COPY on Postgres, executemany elsewhere.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.copy = connection.vendor == "postgresql"
+
+    def write(self, model, columns, constants=None):
+        constants = constants or {}
+        opts = model._meta
+        varying = [opts.get_field(name) for name in columns]
+        fixed = [
+            field
+            for field in opts.local_concrete_fields
+            if field not in varying
+            and not (field.primary_key and isinstance(field, models.AutoField))
+        ]
+        fixed_values = [
+            self.prepare_constant(
+                field, constants.get(field.attname, models.NOT_PROVIDED)
+            )
+            for field in fixed
+        ]
+        values = [self.prepare(column) for column in columns.values()]
 
-# User modeldi alıw
-User = get_user_model()
-fake = Faker()
+        quote = connection.ops.quote_name
+        table = quote(opts.db_table)
+        names = ", ".join(quote(field.column) for field in varying + fixed)
+        count = len(values[0])
+        for start in range(0, count, self.batch_size):
+            chunk = [column[start : start + self.batch_size] for column in values]
+            with transaction.atomic(), connection.cursor() as cursor:
+                if self.copy:
+                    self.copy_rows(cursor, table, names, chunk, fixed_values)
+                else:
+                    placeholders = ", ".join(["%s"] * (len(varying) + len(fixed)))
+                    cursor.executemany(
+                        f"INSERT INTO {table} ({names}) VALUES ({placeholders})",
+                        [row + tuple(fixed_values) for row in zip(*chunk)],
+                    )
+        return count
+
+    def copy_rows(self, cursor, table, names, chunk, fixed_values):
+        suffix = "".join("\t" + _copy_text(value) for value in fixed_values) + "\n"
+        text = [list(map(_copy_text, column)) for column in chunk]
+        buffer = io.StringIO()
+        buffer.writelines("\t".join(row) + suffix for row in zip(*text))
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({names}) FROM STDIN", buffer)
+
+    def prepare_constant(self, field, value):
+        if value is models.NOT_PROVIDED:
+            if field.has_default():
+                value = field.get_default()
+            elif field.null:
+                value = None
+            elif getattr(field, "auto_now", False) or getattr(
+                field, "auto_now_add", False
+            ):
+                value = timezone.now()
+            else:
+                value = field.get_default()
+        if isinstance(field, models.JSONField):
+            return json.dumps(value)
+        return field.get_db_prep_save(value, connection)
+
+    def prepare(self, column):
+        if not isinstance(column, np.ndarray):
+            return column
+        if column.dtype.kind != "M":
+            return column.tolist()
+        # datetime64[us] in UTC, NaT -> NULL
+        text = np.datetime_as_string(column, unit="us")
+        if self.copy:
+            text = np.char.add(text, "+00:00")
+        else:
+            text = np.char.replace(text, "T", " ")
+        text = text.tolist()
+        for index in np.flatnonzero(np.isnat(column)).tolist():
+            text[index] = None
+        return text
+
+    def reset_sequences(self, *models):
+        # Rows were written with explicit ids
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
 
 
 class Command(BaseCommand):
-    help = "Bazani feyk magliwmatlar ham JPEG suwretler menen toltiriw"
+    help = (
+        "Bazani feyk magliwmatlar menen toltiriw: power-law follow grafi, "
+        "like, kommentariya ham hashtaglar (benchmark ushin million qatarga shekem)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=50)
+        parser.add_argument(
+            "--follows",
+            type=float,
+            default=8,
+            help="Bir paydalaniwshinin ortasha follow sani",
+        )
+        parser.add_argument(
+            "--likes", type=float, default=5, help="Bir posttin ortasha like sani"
+        )
+        parser.add_argument(
+            "--comments",
+            type=float,
+            default=2,
+            help="Bir posttin ortasha kommentariya sani",
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.0,
+            help="Power-law darejesi: qansha ulken bolsa, follower lar sonsha az akkauntta jiynaladi",
+        )
+        parser.add_argument(
+            "--days", type=int, default=90, help="Postlar songi neshe kunge tarqaladi"
+        )
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=24,
+            help="Barliq qatarlar qayta paydalanatugin suwretler sani",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=100_000)
+        parser.add_argument(
+            "--skip-derived",
+            action="store_true",
+            help="Timeline ham explore ballarin qurmaw (ulken bazada kop waqit aladi)",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.rng = np.random.default_rng(options["seed"])
+        self.fake = Faker()
+        self.fake.seed_instance(options["seed"])
+        self.loader = Loader(options["batch_size"])
+        now = timezone.now().replace(tzinfo=None)
+        self.now = np.datetime64(now, "us")
+        self.begin = np.datetime64(now - timedelta(days=options["days"]), "us")
+
+        users, posts = options["users"], options["posts"]
+        first_user = (CustomUser.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+        first_post = (Post.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+        user_ids = np.arange(first_user, first_user + users)
+
+        self.stdout.write(f" {options['images']} suwret jaratilip atir...")
+        avatars = self.image_pool("avatar", options["images"], 200, 200)
+        photos = self.image_pool("post", options["images"], 800, 600)
+
+        # Who gets followed, and who posts, likes and comments most
+        popularity = self.power_law(users, options["skew"])
+        activity = self.power_law(users, options["skew"])
+
+        followers, followed = self.follow_graph(
+            users, options["follows"], popularity, options["batch_size"]
+        )
+        authors = self.sample(activity, posts)
+        self.write_users(
+            user_ids,
+            avatars,
+            posts_count=np.bincount(authors, minlength=users),
+            followers_count=np.bincount(followed, minlength=users),
+            following_count=np.bincount(followers, minlength=users),
+        )
+        # through rows: from_customuser is followed by to_customuser
+        self.loader.write(
+            Follow,
+            {
+                "from_customuser_id": user_ids[followed],
+                "to_customuser_id": user_ids[followers],
+            },
+        )
+        self.stdout.write(f" {users} paydalaniwshi, {len(followers)} follow jazildi")
+        del followers, followed
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write("Skript iske tusti...")
+        tag_ids = self.write_posts(
+            first_post, user_ids[authors], photos, activity, user_ids, options
+        )
+        Hashtag.objects.filter(pk__in=tag_ids).update(**exact_counts(Hashtag))
 
-        # 1. Userler
-        users = self.create_users(20)  # 20 paydalanıwshı (tezirek bolıwı ushın)
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        if not options["skip_derived"]:
+            call_command("rebuild_timelines", stdout=self.stdout)
+            call_command("update_explore_scores", full=True, stdout=self.stdout)
 
-        # 2. Follows
-        self.create_follows(users)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Barliq jumislar juwmaqlandi! ({elapsed:.0f} s)")
+        )
+
+    def power_law(self, count, skew):
+        """CDF over user indices; weight rank ** -skew, ranks shuffled."""
+        weights = (self.rng.permutation(count) + 1.0) ** -skew
+        cdf = np.cumsum(weights)
+        return cdf / cdf[-1]
+
+    def sample(self, cdf, size):
+        picks = np.searchsorted(cdf, self.rng.random(size), side="right")
+        return np.minimum(picks, len(cdf) - 1)
 
-        # 3. Postlar
-        posts = self.create_posts(users, 50)  # 50 post
+    def amounts(self, mean, size):
+        """Log-normal per-row amounts with the given mean: most small, a few huge."""
+        if mean <= 0:
+            return np.zeros(size, dtype=np.int64)
+        sigma = 1.0
+        values = self.rng.lognormal(math.log(mean) - sigma**2 / 2, sigma, size)
+        return values.round().astype(np.int64)
 
-        # 4. Interactions (Likes & Comments)
-        self.create_interactions(users, posts)
+    def spread(self, count, begin, end):
+        """``count`` increasing datetimes between begin and end, so ids follow time."""
+        span = (end - begin).astype(np.int64)
+        steps = (np.arange(count) + self.rng.random(count)) / max(count, 1)
+        return begin + (steps * span).astype("timedelta64[us]")
 
-        self.stdout.write(self.style.SUCCESS("Barliq jumislar juwmaqlandi!"))
+    def pool(self, make, size=TEXT_POOL_SIZE):
+        return [make() for _ in range(size)]
 
-    def get_random_image(self, width=600, height=600):
+    def pick(self, pool, size):
+        return [pool[index] for index in self.rng.integers(0, len(pool), size).tolist()]
+
+    def image_pool(self, kind, count, width, height):
         """
-        Random rendegi JPEG suwret jaratip beredi.
+        ``count`` synthetic images rendered in the image pool, saved once with
+        their variants; rows get the column values of a random one.
         """
-        # Random reń (R, G, B)
-        color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-
-        # Súwret jaratıw
-        image = Image.new("RGB", (width, height), color)
-
-        # Fayldı yadta (RAM) saqlaw
-        file_obj = io.BytesIO()
-        image.save(file_obj, format="JPEG")  # JPEG formatına ótkeriw
-
-        return ContentFile(file_obj.getvalue())
-
-    def create_users(self, n):
-        self.stdout.write(f" {n} paydalaniwshi jaratilip atir...")
-        users = []
-        for _ in range(n):
-            username = fake.user_name()
-            while User.objects.filter(username=username).exists():
-                username = username + str(random.randint(1, 999))
-
-            user = User.objects.create_user(
-                username=username,
-                email=fake.email(),
-                password="password123",
-                first_name=fake.first_name(),
-                last_name=fake.last_name(),
-                bio=fake.text(max_nb_chars=100),
-                website=fake.url(),
+        prefix = images.IMAGE_FIELDS[kind]
+        model = CustomUser if kind == "avatar" else Post
+        upload_to = model._meta.get_field(prefix).upload_to
+        sizes = settings.IMAGE_VARIANTS[kind]
+        seeds = self.rng.integers(0, 2**31, count).tolist()
+
+        pool = images.get_pool()
+        sources = list(
+            pool.map(images.synthetic, [width] * count, [height] * count, seeds)
+        )
+        rendered = pool.map(images.render_variants, sources, [sizes] * count)
+
+        rows = []
+        for index, (data, (meta, encoded)) in enumerate(zip(sources, rendered)):
+            name = default_storage.save(
+                f"{upload_to}seed_{index}.jpg", ContentFile(data)
             )
+            row = {prefix: name}
+            row[f"{prefix}_variants"] = json.dumps(images.save_variants(name, encoded))
+            row.update({f"{prefix}_{key}": meta[key] for key in images.METADATA_KEYS})
+            rows.append(row)
+        return rows
 
-            # Avatar ushın 200x200 súwret
-            file_name = f"avatar_{user.id}.jpg"
-            image_content = self.get_random_image(200, 200)
-            user.avatar.save(file_name, image_content, save=True)
-
-            users.append(user)
-        return users
-
-    def create_follows(self, users):
-        self.stdout.write(" Follow baylanislari jaratilip atir...")
-        count = 0
-        for user in users:
-            possible_friends = [u for u in users if u != user]
-            to_follow = random.sample(possible_friends, k=random.randint(3, 10))
-            user.followers.add(*to_follow)
-            count += len(to_follow)
-        self.stdout.write(f"Jami {count} follow baylanisi ornatildi!")
-
-    def create_posts(self, users, n):
-        self.stdout.write(f"{n} post jaratilip atir...")
-        posts = []
-        for _ in range(n):
-            author = random.choice(users)
-            post = Post(
-                author=author,
-                caption=fake.paragraph(nb_sentences=3),
+    def image_columns(self, rows, size):
+        picked = self.pick(rows, size)
+        return {key: [row[key] for row in picked] for key in rows[0]}
+
+    def follow_graph(self, users, mean, popularity, chunk_size):
+        """(follower, followed) index pairs without duplicates or self-follows."""
+        degrees = np.minimum(self.amounts(mean, users), users - 1)
+        followers, followed = [], []
+        for start in range(0, users, chunk_size):
+            stop = min(start + chunk_size, users)
+            source = np.repeat(np.arange(start, stop), degrees[start:stop])
+            target = self.sample(popularity, len(source))
+            # Duplicates only happen within one follower, so per chunk is exact
+            pairs = np.unique(source * users + target)
+            source, target = pairs // users, pairs % users
+            keep = source != target
+            followers.append(source[keep])
+            followed.append(target[keep])
+        return np.concatenate(followers), np.concatenate(followed)
+
+    def write_users(self, user_ids, avatars, **counts):
+        count = len(user_ids)
+        first_names = self.pool(self.fake.first_name)
+        usernames = [
+            f"{name.lower()}_{user_id}"
+            for name, user_id in zip(self.pick(first_names, count), user_ids.tolist())
+        ]
+        joined = self.spread(count, self.begin - np.timedelta64(365, "D"), self.begin)
+        columns = {
+            "id": user_ids,
+            "username": usernames,
+            "email": [f"{username}@example.com" for username in usernames],
+            "first_name": self.pick(first_names, count),
+            "last_name": self.pick(self.pool(self.fake.last_name), count),
+            "bio": self.pick(
+                self.pool(lambda: self.fake.text(max_nb_chars=100)), count
+            ),
+            "website": self.pick(self.pool(self.fake.url), count),
+            **self.image_columns(avatars, count),
+            "date_joined": joined,
+            "created_at": joined,
+            "updated_at": joined,
+            **counts,
+        }
+        # One PBKDF2 run for everybody instead of one per user
+        self.loader.write(
+            CustomUser, columns, constants={"password": make_password(PASSWORD)}
+        )
+        self.loader.reset_sequences(CustomUser)
+
+    def captions(self):
+        """Caption pool, plus a CSR (indptr, hashtag ids) of the tags of each caption."""
+        words = sorted({self.fake.word().lower() for _ in range(300)})
+        captions = []
+        for _ in range(TEXT_POOL_SIZE):
+            tags = self.rng.choice(words, size=self.rng.integers(0, 4), replace=False)
+            captions.append(
+                " ".join(
+                    [self.fake.sentence(nb_words=10)] + [f"#{tag}" for tag in tags]
+                )
             )
+        names = [hashtags.extract(caption) for caption in captions]
+        ids = hashtags.hashtag_ids(set().union(*names))
+        indptr = np.cumsum([0] + [len(tags) for tags in names])
+        tag_ids = np.array([ids[name] for tags in names for name in sorted(tags)])
+        return captions, indptr, tag_ids.astype(np.int64)
 
-            # Post ushın 800x600 súwret
-            file_name = f"post_{random.randint(1000,9999)}.jpg"
-            image_content = self.get_random_image(800, 600)
-            post.image.save(file_name, image_content, save=False)
-
-            post.save()
-            posts.append(post)
-        return posts
-
-    def create_interactions(self, users, posts):
-        self.stdout.write(" Like ham Kommentariyalar jaratilip atir...")
-        like_count = 0
-        comment_count = 0
-
-        for post in posts:
-            # Likes
-            likers = random.sample(users, k=random.randint(0, min(10, len(users))))
-            for liker in likers:
-                if liker != post.author:
-                    post.likes.add(liker)
-                    like_count += 1
-
-            # Comments
-            num_comments = random.randint(0, 5)
-            for _ in range(num_comments):
-                commenter = random.choice(users)
-                Comment.objects.create(user=commenter, post=post, text=fake.sentence())
-                comment_count += 1
+    def engagement(self, count, mean, activity, created, unique=False):
+        """Post index, user index and time of each like/comment on ``count`` posts."""
+        posts = np.repeat(np.arange(count), self.amounts(mean, count))
+        users = self.sample(activity, len(posts))
+        if unique:
+            pairs = np.unique(posts * len(activity) + users)
+            posts, users = pairs // len(activity), pairs % len(activity)
+        # Most engagement comes in the first hours after posting
+        delay = self.rng.exponential(6 * 3600 * 10**6, len(posts))
+        at = np.minimum(created[posts] + delay.astype("timedelta64[us]"), self.now)
+        return posts, users, at
 
-        self.stdout.write(
-            f"{like_count} like ham {comment_count} kommentariya qosildi!")
+    def write_posts(self, first_post, authors, photos, activity, user_ids, options):
+        total = len(authors)
+        batch_size = options["batch_size"]
+        created_all = self.spread(total, self.begin, self.now)
+        captions, indptr, caption_tags = self.captions()
+        comment_texts = self.pool(self.fake.sentence)
+
+        for start in range(0, total, batch_size):
+            stop = min(start + batch_size, total)
+            count = stop - start
+            post_ids = np.arange(first_post + start, first_post + stop)
+            created = created_all[start:stop]
+            likes = self.engagement(
+                count, options["likes"], activity, created, unique=True
+            )
+            comments = self.engagement(count, options["comments"], activity, created)
+
+            # Latest like or comment; NaT (int64 min) where there is none
+            engaged = np.full(count, np.iinfo(np.int64).min)
+            for posts, _, at in (likes, comments):
+                np.maximum.at(engaged, posts, at.astype(np.int64))
+
+            picks = self.rng.integers(0, len(captions), count)
+            self.loader.write(
+                Post,
+                {
+                    "id": post_ids,
+                    "author_id": authors[start:stop],
+                    **self.image_columns(photos, count),
+                    "caption": [captions[index] for index in picks.tolist()],
+                    "created_at": created,
+                    "updated_at": created,
+                    "engaged_at": engaged.astype("datetime64[us]"),
+                    "likes_count": np.bincount(likes[0], minlength=count),
+                    "comments_count": np.bincount(comments[0], minlength=count),
+                },
+            )
+            posts, users, at = likes
+            self.loader.write(
+                PostLike,
+                {
+                    "user_id": user_ids[users],
+                    "post_id": post_ids[posts],
+                    "created_at": at,
+                },
+            )
+            posts, users, at = comments
+            self.loader.write(
+                Comment,
+                {
+                    "user_id": user_ids[users],
+                    "post_id": post_ids[posts],
+                    "text": self.pick(comment_texts, len(posts)),
+                    "created_at": at,
+                },
+            )
+
+            # Tags of each post's caption: the CSR rows of the picked captions
+            tagged = indptr[picks + 1] - indptr[picks]
+            posts = np.repeat(np.arange(count), tagged)
+            offsets = np.arange(len(posts)) - np.repeat(
+                np.cumsum(tagged) - tagged, tagged
+            )
+            self.loader.write(
+                PostHashtag,
+                {
+                    "post_id": post_ids[posts],
+                    "hashtag_id": caption_tags[indptr[picks][posts] + offsets],
+                    "created_at": created[posts],
+                },
+            )
+            self.stdout.write(f" {stop}/{total} post jazildi...")
+
+        self.loader.reset_sequences(Post)
+        return np.unique(caption_tags).tolist()
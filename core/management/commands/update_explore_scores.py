@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from core import explore
+
+
+class Command(BaseCommand):
+    help = "Explore ushin postlardin reytingin (waqit penen azayatugin) janalaw"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=explore.BATCH_SIZE)
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Songi iske tusiriwden baslap emes, barliq postlardi tekseriw",
+        )
+
+    def handle(self, *args, **options):
+        since = explore.EPOCH if options["full"] else None
+        scored = explore.update_scores(since, options["batch_size"])
+        pruned = explore.prune()
+        top = explore.refresh_top()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{scored} post reytingi janalandi, {pruned} eski oshirildi, top {len(top)}"
+            )
+        )
@@ -0,0 +1,159 @@
+import os
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Under gunicorn every worker writes its samples to mmap files in
+# PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py) and /metrics merges them
+REQUESTS = Counter(
+    "http_requests_total", "Requests by view", ["view", "method", "status"]
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent in Django, middleware included",
+    ["view"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries per request",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Time spent waiting on the database per request",
+    ["view"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Response body size",
+    ["view"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+
+class QueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# The stats of the request being served. Context variables follow the request
+# into the threads sync_to_async runs the async ORM in, where a per-request
+# execute_wrapper on the event loop thread's connection would see nothing.
+_current = ContextVar("metrics_query_stats", default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - start
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+connection_created.connect(install_query_counter, dispatch_uid="core.metrics")
+
+
+def view_label(request):
+    """
+    "PostViewSet.like", "FeedAPIView.list": the DRF class and action, so the
+    label set stays as small as the URL conf whatever the ids in the path.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    view = match.func
+    # core/async_views.py label their views as the viewset actions they replace
+    cls, actions = getattr(view, "metrics_view", (None, None))
+    cls = cls or getattr(view, "cls", None)
+    if cls is None:
+        return match.view_name or view.__name__
+    method = request.method.lower()
+    actions = actions or getattr(view, "actions", None) or {}
+    return f"{cls.__name__}.{actions.get(method, method)}"
+
+
+class MetricsMiddleware:
+    """
+    Keep it first in MIDDLEWARE so the latency covers the whole stack. Runs
+    natively under WSGI and ASGI, so it never forces async views into a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, stats, elapsed):
+        match = getattr(request, "resolver_match", None)
+        if match is not None and match.func is metrics:
+            return
+        view = view_label(request)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        LATENCY.labels(view).observe(elapsed)
+        QUERIES.labels(view).observe(stats.count)
+        DB_TIME.labels(view).observe(stats.seconds)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(view).observe(len(response.content))
+
+
+def metrics(request):
+    """Prometheus text format; nginx keeps it internal, scrape web:8000."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
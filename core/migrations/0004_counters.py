@@ -0,0 +1,70 @@
+# Generated by Django 5.2.10 on 2026-10-18 20:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(model, field):
+    rows = (
+        model.objects.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+def fill_counters(apps, schema_editor):
+    CustomUser = apps.get_model("core", "CustomUser")
+    Post = apps.get_model("core", "Post")
+    Comment = apps.get_model("core", "Comment")
+    Follow = CustomUser.followers.through
+    Like = Post.likes.through
+
+    Post.objects.update(
+        likes_count=_count(Like, "post_id"),
+        comments_count=_count(Comment, "post_id"),
+    )
+    CustomUser.objects.update(
+        posts_count=_count(Post, "author_id"),
+        followers_count=_count(Follow, "from_customuser_id"),
+        following_count=_count(Follow, "to_customuser_id"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="followers_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="following_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="posts_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="comments_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="likes_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.10 on 2026-10-18 20:34
+
+from django.db import migrations, models
+
+RECENT_ACTORS = 3
+
+
+def merge_duplicates(apps, schema_editor):
+    # One like row per (receiver, post) and one follow row per receiver
+    Notification = apps.get_model("core", "Notification")
+    groups = {}
+    rows = Notification.objects.filter(type__in=["like", "follow"]).order_by(
+        "-created_at", "-id"
+    )
+    for notification in rows.iterator():
+        key = (notification.type, notification.receiver_id, notification.post_id)
+        if notification.type == "follow":
+            key = ("follow", notification.receiver_id, None)
+        groups.setdefault(key, []).append(notification)
+
+    for group in groups.values():
+        latest = group[0]
+        actors = list(dict.fromkeys(n.sender_id for n in group))
+        latest.actors_count = len(actors)
+        latest.recent_actors = actors[:RECENT_ACTORS]
+        latest.is_read = all(n.is_read for n in group)
+        latest.save(update_fields=["actors_count", "recent_actors", "is_read"])
+        if len(group) > 1:
+            Notification.objects.filter(pk__in=[n.pk for n in group[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="actors_count",
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="recent_actors",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="notification",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("type", "like")),
+                fields=("receiver", "post", "type"),
+                name="core_notification_like_uniq",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="notification",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("type", "follow")),
+                fields=("receiver", "type"),
+                name="core_notification_follow_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# Indexes behind core/search.py. Expression and operator-class indexes differ
+# per backend, so they are created here rather than in CustomUser.Meta.
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # LOWER(username) LIKE 'prefix%'
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS core_user_username_prefix_idx "
+    "ON core_customuser (LOWER(username) text_pattern_ops)",
+    # UPPER(username) LIKE '%infix%' (autocomplete fallback and SearchFilter)
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS core_user_username_trgm_idx "
+    "ON core_customuser USING gin (UPPER(username::text) gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX CONCURRENTLY IF EXISTS core_user_username_trgm_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS core_user_username_prefix_idx",
+]
+# Range scans on LOWER(username)
+DEFAULT_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS core_user_username_prefix_idx "
+    "ON core_customuser (LOWER(username))",
+]
+DEFAULT_BACKWARD = ["DROP INDEX IF EXISTS core_user_username_prefix_idx"]
+
+
+def create_indexes(apps, schema_editor):
+    postgres = schema_editor.connection.vendor == "postgresql"
+    for sql in POSTGRES_FORWARD if postgres else DEFAULT_FORWARD:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    postgres = schema_editor.connection.vendor == "postgresql"
+    for sql in POSTGRES_BACKWARD if postgres else DEFAULT_BACKWARD:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("core", "0009_uploadsession"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
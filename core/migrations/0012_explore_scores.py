@@ -0,0 +1,56 @@
+# Generated by Django 5.2.10 on 2026-10-18 20:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def mark_engaged_posts(apps, schema_editor):
+    # So the first update_explore_scores run picks up existing engagement
+    Post = apps.get_model("core", "Post")
+    Post.objects.filter(Q(likes_count__gt=0) | Q(comments_count__gt=0)).update(
+        engaged_at=F("created_at")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_hashtags"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="engaged_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(mark_engaged_posts, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="PostScore",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="score",
+                        serialize=False,
+                        to="core.post",
+                    ),
+                ),
+                ("score", models.FloatField(blank=True, null=True)),
+                ("likes_seen", models.IntegerField(default=0)),
+                ("comments_seen", models.IntegerField(default=0)),
+                ("scored_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["-score"], name="core_postscore_score_idx"),
+                    models.Index(
+                        fields=["scored_at"], name="core_postscore_scored_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.10 on 2026-10-18 20:55
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 5000
+
+
+def _copy(rows, model, make):
+    batch = []
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        batch.append(make(*row))
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    model.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def merge_likes(apps, schema_editor):
+    # Move the auto-created Post.likes table into PostLike, which becomes its
+    # through model below, and drop the old table
+    OldLike = apps.get_model("core", "Post_likes")
+    PostLike = apps.get_model("core", "PostLike")
+    rows = OldLike.objects.order_by("pk").values_list("post_id", "customuser_id")
+    _copy(
+        rows,
+        PostLike,
+        lambda post_id, user_id: PostLike(post_id=post_id, user_id=user_id),
+    )
+    schema_editor.delete_model(OldLike)
+
+
+def split_likes(apps, schema_editor):
+    OldLike = apps.get_model("core", "Post_likes")
+    PostLike = apps.get_model("core", "PostLike")
+    schema_editor.create_model(OldLike)
+    rows = PostLike.objects.order_by("pk").values_list("post_id", "user_id")
+    _copy(
+        rows,
+        OldLike,
+        lambda post_id, user_id: OldLike(post_id=post_id, customuser_id=user_id),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_follow_suggestions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="postlike",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(merge_likes, split_likes),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="post",
+                    name="likes",
+                    field=models.ManyToManyField(
+                        blank=True,
+                        related_name="liked_posts",
+                        through="core.PostLike",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="postlike",
+            index=models.Index(
+                fields=["post", "-created_at", "-id"], name="core_postlike_post_idx"
+            ),
+        ),
+    ]
@@ -1,9 +1,44 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
 
-class CustomUser(AbstractUser):
+class CounterFieldsMixin:
+    """
+    Leaves ``counter_fields`` out of full saves of existing rows: they are
+    only written by UPDATE ... SET x = x + n (core/counters.py), and an
+    instance loaded before such an update would write the old value back.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.attname
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class CustomUser(CounterFieldsMixin, AbstractUser):
     avatar = models.ImageField(upload_to="avatars/", null=True, blank=True)
+    # Resized JPEG/WebP copies, filled in the background by core/images.py
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Set on upload / by the variants worker so pages never open the file
+    avatar_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    avatar_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    avatar_size = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    avatar_color = models.CharField(max_length=7, blank=True, editable=False)
+    avatar_placeholder = models.TextField(blank=True, editable=False)
     bio = models.TextField(max_length=200, blank=True)
     website = models.URLField(max_length=50, blank=True)
     followers = models.ManyToManyField(
@@ -12,6 +47,12 @@ class CustomUser(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Kept up to date by core/signals.py, repaired by reconcile_counters
+    posts_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+    counter_fields = ("posts_count", "followers_count", "following_count")
+
     groups = models.ManyToManyField(
         "auth.Group",
         related_name="customuser_set",
@@ -30,26 +71,81 @@ class CustomUser(AbstractUser):
         return self.username
 
 
-class Post(models.Model):
+class Post(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE, related_name="posts"
     )
     image = models.ImageField(upload_to="posts/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_size = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_color = models.CharField(max_length=7, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)
     caption = models.TextField(max_length=2000, blank=True)
-    likes = models.ManyToManyField(CustomUser, related_name="liked_posts", blank=True)
+    likes = models.ManyToManyField(
+        CustomUser, related_name="liked_posts", blank=True, through="PostLike"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+    # Last like/comment change, see core/explore.py
+    engaged_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    counter_fields = ("likes_count", "comments_count", "engaged_at")
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["author", "-created_at", "-id"], name="core_post_author_idx"
+            ),
+            models.Index(fields=["-created_at", "-id"], name="core_post_created_idx"),
+        ]
+
     def __str__(self):
         return f" Post by {self.author} "
 
 
+class PostScore(models.Model):
+    """
+    Time-decayed engagement score of a post, kept by update_explore_scores.
+    ``score`` is log-space against a fixed epoch, so it never needs rescaling.
+    """
+
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True, related_name="score"
+    )
+    score = models.FloatField(null=True, blank=True)
+    likes_seen = models.IntegerField(default=0)
+    comments_seen = models.IntegerField(default=0)
+    scored_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-score"], name="core_postscore_score_idx"),
+            models.Index(fields=["scored_at"], name="core_postscore_scored_idx"),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} score {self.score}"
+
+
 class PostLike(models.Model):
+    """The through table of Post.likes; core/likes.py toggles rows in one statement."""
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="likes")
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="post_likes")
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # (user, post) also answers "which of these posts did the viewer like"
         unique_together = ("user", "post")
+        indexes = [
+            models.Index(
+                fields=["post", "-created_at", "-id"], name="core_postlike_post_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} likes post {self.post.id}"
@@ -63,6 +159,13 @@ class Comment(models.Model):
     text = models.TextField(max_length=500)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["post", "-created_at", "-id"], name="core_comment_post_idx"
+            ),
+        ]
+
     def __str__(self):
         return (
             f"{self.user.username} mina  {self.post.id} id nomerli postqa comment jazdi"
@@ -83,5 +186,168 @@ class Notification(models.Model):
     is_read = models.BooleanField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Like / follow notifications are coalesced: sender is the latest actor
+    actors_count = models.IntegerField(default=1)
+    recent_actors = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["receiver", "post", "type"],
+                condition=models.Q(type="like"),
+                name="core_notification_like_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["receiver", "type"],
+                condition=models.Q(type="follow"),
+                name="core_notification_follow_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["receiver", "-created_at", "-id"],
+                name="core_notif_receiver_idx",
+            ),
+            # Unread count and mark_read only ever look at unread rows
+            models.Index(
+                fields=["receiver"],
+                condition=models.Q(is_read=False),
+                name="core_notif_unread_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Notification for {self.receiver.username} from {self.sender.username} "
+
+
+class Hashtag(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    # Kept up to date by core/hashtags.py, repaired by reconcile_counters
+    posts_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.name}"
+
+
+class PostHashtag(models.Model):
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="post_hashtags"
+    )
+    hashtag = models.ForeignKey(
+        Hashtag, on_delete=models.CASCADE, related_name="post_hashtags"
+    )
+    # Copied from the post so a tag page is a range scan on one index
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "hashtag"], name="core_posthashtag_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["hashtag", "-created_at", "-id"],
+                name="core_posthashtag_tag_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} #{self.hashtag_id}"
+
+
+class FollowSuggestion(models.Model):
+    """Precomputed by compute_follow_suggestions; the request path only reads."""
+
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="follow_suggestions"
+    )
+    suggested = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="+"
+    )
+    # People the user follows who follow ``suggested``
+    mutuals = models.IntegerField()
+    score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "suggested"], name="core_suggestion_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-score"], name="core_suggestion_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"Suggest {self.suggested_id} to {self.user_id}"
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="+")
+    # Copied from the post so a feed page is a range scan on one index
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"], name="core_timeline_user_post_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-created_at", "-id"], name="core_timeline_user_idx"
+            ),
+            models.Index(fields=["user", "author"], name="core_timeline_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in timeline of {self.user_id}"
+
+
+class OutboxEvent(models.Model):
+    """Side effect recorded in the same transaction as the action, see core/outbox.py."""
+
+    kind = models.CharField(max_length=60)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="core_outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id}"
+
+
+class UploadSession(models.Model):
+    """Resumable image upload, written chunk by chunk, see core/uploads.py."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.size})"
@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .counters import exact_counts
+from .db_router import use_primary
+from .models import Notification
+from . import realtime
+
+RECENT_ACTORS = 3
+
+
+def unread_cache_key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def unread_count(user_id):
+    """Cached per-user unread counter; writers drop it via forget_unread()."""
+    key = unread_cache_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        # Cached for an hour: never fill it from a lagging replica
+        use_primary()
+        count = Notification.objects.filter(receiver_id=user_id, is_read=False).count()
+        cache.set(key, count, getattr(settings, "NOTIFICATION_UNREAD_CACHE_TTL", 3600))
+    return count
+
+
+def forget_unread(user_ids):
+    """Drop the unread counters and wake up the users' streams after commit."""
+    user_ids = set(user_ids)
+    keys = [unread_cache_key(user_id) for user_id in user_ids]
+
+    def changed():
+        cache.delete_many(keys)
+        realtime.publish(user_ids)
+
+    transaction.on_commit(changed)
+
+
+def coalesce(kind, events):
+    """
+    Fold (receiver_id, post_id, actor_id) events into one Notification per
+    (receiver, post, kind) using a fixed number of set queries: insert the
+    missing rows, lock all of them, bulk update the actors, then recount
+    actors_count from the source rows. Actors already listed in
+    recent_actors are skipped, so replays are no-ops.
+    """
+    groups = {}
+    for receiver_id, post_id, actor_id in events:
+        if receiver_id != actor_id:
+            groups.setdefault((receiver_id, post_id), []).append(actor_id)
+    if not groups:
+        return
+
+    receiver_ids = {receiver_id for receiver_id, _ in groups}
+    post_ids = {post_id for _, post_id in groups if post_id is not None}
+
+    with transaction.atomic():
+        Notification.objects.bulk_create(
+            [
+                Notification(
+                    sender_id=actors[0],
+                    receiver_id=receiver_id,
+                    post_id=post_id,
+                    type=kind,
+                    is_read=False,
+                    actors_count=0,
+                )
+                for (receiver_id, post_id), actors in groups.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+        rows = Notification.objects.select_for_update().filter(
+            type=kind, receiver_id__in=receiver_ids
+        )
+        if post_ids:
+            rows = rows.filter(post_id__in=post_ids)
+        else:
+            rows = rows.filter(post__isnull=True)
+
+        now = timezone.now()
+        changed = []
+        for notification in rows:
+            actors = groups.get((notification.receiver_id, notification.post_id))
+            if actors is None:
+                continue
+            new = [
+                pk
+                for pk in dict.fromkeys(actors)
+                if pk not in notification.recent_actors
+            ]
+            if not new:
+                continue
+            notification.sender_id = new[-1]
+            notification.recent_actors = (new[::-1] + notification.recent_actors)[
+                :RECENT_ACTORS
+            ]
+            notification.is_read = False
+            notification.created_at = now
+            changed.append(notification)
+
+        Notification.objects.bulk_update(
+            changed, ["sender", "recent_actors", "is_read", "created_at"]
+        )
+        # Counted from the likes / follows themselves: recent_actors only
+        # remembers a few, so adding len(new) drifted with every re-like
+        Notification.objects.filter(pk__in=[row.pk for row in changed]).update(
+            **exact_counts(Notification)
+        )
+        forget_unread(notification.receiver_id for notification in changed)
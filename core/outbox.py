@@ -0,0 +1,156 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Comment, CustomUser, Notification, OutboxEvent, Post, PostLike
+from . import images, notifications, timeline
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+
+    return register
+
+
+def enqueue(kind, **payload):
+    """Record a side effect; it commits or rolls back together with the caller."""
+    event = OutboxEvent.objects.create(kind=kind, payload=payload)
+    if getattr(settings, "OUTBOX_EAGER", False):
+        transaction.on_commit(lambda: process_event(event.pk))
+    return event
+
+
+def pending_ids(limit):
+    max_attempts = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 5)
+    return list(
+        OutboxEvent.objects.filter(processed_at__isnull=True, attempts__lt=max_attempts)
+        .order_by("id")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+def process_event(event_id):
+    """
+    Apply one event and mark it processed in a single transaction, so a
+    failure leaves it pending for a retry. Handlers are written to be safe
+    to replay. Returns False when the event was done or locked elsewhere.
+    """
+    try:
+        with transaction.atomic():
+            event = (
+                OutboxEvent.objects.select_for_update(skip_locked=True)
+                .filter(pk=event_id, processed_at__isnull=True)
+                .first()
+            )
+            if event is None:
+                return False
+            HANDLERS[event.kind](**event.payload)
+            event.processed_at = timezone.now()
+            event.attempts += 1
+            event.save(update_fields=["processed_at", "attempts"])
+    except Exception as exc:
+        logger.exception("Outbox event %s failed", event_id)
+        OutboxEvent.objects.filter(pk=event_id).update(
+            attempts=F("attempts") + 1, last_error=repr(exc)
+        )
+        return False
+    return True
+
+
+def purge(older_than=timedelta(days=1)):
+    cutoff = timezone.now() - older_than
+    return OutboxEvent.objects.filter(processed_at__lt=cutoff).delete()[0]
+
+
+@handler("post_created")
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        timeline.fan_out_post(post)
+
+
+@handler("comment")
+def notify_comment(comment_id):
+    comment = Comment.objects.select_related("post").filter(pk=comment_id).first()
+    if comment is None or comment.user_id == comment.post.author_id:
+        return
+    Notification.objects.create(
+        sender_id=comment.user_id,
+        receiver_id=comment.post.author_id,
+        type="comment",
+        post_id=comment.post_id,
+        is_read=False,
+    )
+    notifications.forget_unread([comment.post.author_id])
+
+
+@handler("like")
+def notify_likes(pairs):
+    authors = dict(
+        Post.objects.filter(pk__in={post_id for post_id, _ in pairs}).values_list(
+            "id", "author_id"
+        )
+    )
+    # Likes undone before the event ran notify nobody
+    liked = set(
+        PostLike.objects.filter(
+            post_id__in=authors, user_id__in={user_id for _, user_id in pairs}
+        ).values_list("post_id", "user_id")
+    )
+    events = [
+        (authors[post_id], post_id, user_id)
+        for post_id, user_id in pairs
+        if (post_id, user_id) in liked
+    ]
+    notifications.coalesce("like", events)
+
+
+def _sync_timelines(pairs):
+    # Reads the current follow state, so events may be replayed or reordered
+    Follow = CustomUser.followers.through
+    following = set(
+        Follow.objects.filter(
+            from_customuser_id__in={author_id for author_id, _ in pairs},
+            to_customuser_id__in={follower_id for _, follower_id in pairs},
+        ).values_list("from_customuser_id", "to_customuser_id")
+    )
+    for author_id, follower_id in pairs:
+        if (author_id, follower_id) in following:
+            timeline.backfill(follower_id, [author_id])
+        else:
+            timeline.prune(follower_id, [author_id])
+    return following
+
+
+@handler("follow")
+def apply_follows(pairs):
+    following = _sync_timelines(pairs)
+    notifications.coalesce(
+        "follow",
+        [
+            (author_id, None, follower_id)
+            for author_id, follower_id in pairs
+            if (author_id, follower_id) in following
+        ],
+    )
+
+
+@handler("unfollow")
+def apply_unfollows(pairs):
+    _sync_timelines(pairs)
+
+
+@handler("image_variants")
+def build_image_variants(target, pk):
+    model = Post if target == "post" else CustomUser
+    instance = model.objects.filter(pk=pk).first()
+    if instance is not None:
+        images.refresh_variants(instance, target)
@@ -0,0 +1,239 @@
+import base64
+import binascii
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    PageNumberPagination with an opt-in keyset (cursor) mode.
+
+    ``?pagination=cursor`` starts cursor mode; the returned ``next`` and
+    ``previous`` links carry an opaque ``cursor`` keyed on ``ordering``
+    (a datetime field and ``id``). Cursor pages need no COUNT(*) and no
+    OFFSET, and rows inserted while the client scrolls do not shift them.
+    Without those params the page-number responses are unchanged.
+    """
+
+    page_size_query_param = "page_size"
+    max_page_size = 50
+    mode_query_param = "pagination"
+    cursor_query_param = "cursor"
+    ordering = ("-created_at", "-id")
+    invalid_cursor_message = "Cursor jaraqsiz"
+
+    def is_cursor_mode(self, request):
+        params = request.query_params
+        return (
+            self.cursor_query_param in params
+            or params.get(self.mode_query_param) == "cursor"
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_mode(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        position, reverse = self.decode_cursor(request)
+        rows = list(self.cursor_queryset(queryset, position, reverse)[: page_size + 1])
+        self.rows = self.build_page(rows, page_size, position, reverse)
+        return self.rows
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views: the same pages, read with the async ORM."""
+        self.cursor_mode = self.is_cursor_mode(request)
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        if self.cursor_mode:
+            position, reverse = self.decode_cursor(request)
+            queryset = self.cursor_queryset(queryset, position, reverse)
+            rows = [row async for row in queryset[: page_size + 1]]
+            self.rows = self.build_page(rows, page_size, position, reverse)
+            return self.rows
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # count is a cached_property: fill it so Paginator never runs it sync
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            )
+        self.page.object_list = [row async for row in self.page.object_list]
+        return list(self.page)
+
+    def cursor_queryset(self, queryset, position, reverse):
+        ordering = self.get_ordering(reverse)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position, ordering))
+        return queryset
+
+    def build_page(self, rows, page_size, position, reverse):
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return rows
+
+    def get_ordering(self, reverse):
+        if not reverse:
+            return self.ordering
+        return tuple(f[1:] if f.startswith("-") else f"-{f}" for f in self.ordering)
+
+    def after(self, position, ordering):
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+        first, second = ordering
+        first_name, second_name = first.lstrip("-"), second.lstrip("-")
+        first_op = "lt" if first.startswith("-") else "gt"
+        second_op = "lt" if second.startswith("-") else "gt"
+        return Q(**{f"{first_name}__{first_op}": position[0]}) | Q(
+            **{first_name: position[0], f"{second_name}__{second_op}": position[1]}
+        )
+
+    def get_position(self, row):
+        return tuple(getattr(row, field.lstrip("-")) for field in self.ordering)
+
+    def make_cursor(self, row, reverse=False):
+        values = self.encode_position(self.get_position(row))
+        raw = "|".join([str(int(reverse)), *values])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def encode_position(self, position):
+        created_at, pk = position
+        return [created_at.isoformat(), str(pk)]
+
+    def decode_position(self, values):
+        created_at, pk = values
+        position = (parse_datetime(created_at), int(pk))
+        if position[0] is None:
+            raise ValueError(created_at)
+        return position
+
+    def encode_cursor(self, row, reverse):
+        cursor = self.make_cursor(row, reverse)
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        return self.parse_cursor(cursor)
+
+    def parse_cursor(self, cursor):
+        """make_cursor() output -> (position, reverse); NotFound if malformed."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            reverse, *values = raw.split("|")
+            position = self.decode_position(values)
+        except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse == "1"
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+
+class IdKeysetPagination(KeysetPagination):
+    """
+    KeysetPagination keyed on ``id`` alone, for tables without a timestamp
+    (the follow through table, whose row id is the follow order).
+    """
+
+    ordering = ("-id",)
+
+    def after(self, position, ordering):
+        (field,) = ordering
+        op = "lt" if field.startswith("-") else "gt"
+        return Q(**{f"{field.lstrip('-')}__{op}": position[0]})
+
+    def encode_position(self, position):
+        return [str(position[0])]
+
+    def decode_position(self, values):
+        (pk,) = values
+        return (int(pk),)
+
+
+class CursorPagination(KeysetPagination):
+    """KeysetPagination that is always in cursor mode (no COUNT(*) at all)."""
+
+    def is_cursor_mode(self, request):
+        return True
+
+
+class NotificationSincePagination(KeysetPagination):
+    """
+    Delta sync: ``?since=`` takes the cursor from a previous response and
+    returns only rows that are newer, oldest first; without it, everything
+    from the oldest row. Coalesced rows bump their created_at, so they come
+    again. The cursor carries the (created_at, id) position itself: a bare
+    notification id is rejected, since that row's created_at moves forward
+    when it is coalesced and would skip rows created in between.
+    ``next`` always points past the last returned row; when nothing is new
+    it is null and the client keeps polling with its previous cursor.
+    """
+
+    ordering = ("created_at", "id")
+    cursor_query_param = "since"
+
+    def is_cursor_mode(self, request):
+        return True
+
+    def get_next_link(self):
+        if not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1], reverse=False)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "has_more": self.has_next,
+                "results": data,
+            }
+        )
@@ -0,0 +1,74 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+HITS_KEY = "profile:stats:hits"
+MISSES_KEY = "profile:stats:misses"
+
+
+def version_key(user_id):
+    return f"profile:ver:{user_id}"
+
+
+def payload_key(user_id, version, host):
+    return f"profile:{user_id}:{version}:{host}"
+
+
+def get_version(user_id):
+    """
+    The user's current version stamp. Stamps are random, never incremented,
+    so an evicted stamp can not come back and revive an old payload.
+    """
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_payload(user_id, host):
+    """
+    (payload or None, version). Store a fresh payload under the returned
+    version: if the profile changes meanwhile, it lands under a dead stamp.
+    """
+    version = get_version(user_id)
+    data = cache.get(payload_key(user_id, version, host))
+    _count(MISSES_KEY if data is None else HITS_KEY)
+    return data, version
+
+
+def set_payload(user_id, version, host, data):
+    ttl = getattr(settings, "PROFILE_CACHE_TTL", 300)
+    cache.set(payload_key(user_id, version, host), data, ttl)
+
+
+def invalidate(user_ids):
+    """New stamps for these users once the current transaction commits."""
+    keys = [version_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def stats():
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else None,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
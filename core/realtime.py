@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import threading
+from contextlib import contextmanager
+import redis
+from redis import asyncio as aioredis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Push for /api/notifications/stream/. The broker carries wakeups, not rows:
+# publish() says "user N has news", each open stream then reads what is newer
+# than the last row it sent. A connection is one asyncio.Event however many
+# notifications arrive, and a consumer that cannot keep up just finds the
+# event already set and catches up from the database in batches.
+
+logger = logging.getLogger(__name__)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class Subscription:
+    __slots__ = ("user_id", "loop", "event")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def notify(self):
+        """Thread-safe: publishers run in request threads and the outbox worker."""
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # Event loop already closed; the stream is gone with it
+            pass
+
+    async def wait(self, timeout):
+        """True when woken up, False after ``timeout`` seconds of silence."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+
+class LocalBroker:
+    """
+    Streams of this process only: enough for one node with OUTBOX_EAGER and
+    for tests. A separate outbox_worker process needs RedisBroker.
+    """
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self.lock:
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.user_id, None)
+
+    def deliver(self, user_ids):
+        with self.lock:
+            targets = [
+                subscription
+                for user_id in user_ids
+                for subscription in self.subscriptions.get(user_id, ())
+            ]
+        for subscription in targets:
+            subscription.notify()
+
+    def deliver_all(self):
+        with self.lock:
+            user_ids = list(self.subscriptions)
+        self.deliver(user_ids)
+
+    def publish(self, user_ids):
+        self.deliver(user_ids)
+
+
+class RedisBroker(LocalBroker):
+    """
+    One pub/sub channel for the whole cluster. Every web process keeps a
+    single listener task that hands the user ids to its own subscriptions.
+    """
+
+    channel = "notifications:push"
+
+    def __init__(self):
+        super().__init__()
+        self.client = redis.Redis.from_url(settings.REDIS_URL)
+        self.listener = None
+
+    def publish(self, user_ids):
+        self.client.publish(self.channel, json.dumps(sorted(user_ids)))
+
+    def subscribe(self, user_id):
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+        return super().subscribe(user_id)
+
+    async def listen(self):
+        while True:
+            try:
+                async with aioredis.Redis.from_url(settings.REDIS_URL) as client:
+                    async with client.pubsub() as pubsub:
+                        await pubsub.subscribe(self.channel)
+                        # Messages published while disconnected are lost: recheck all
+                        self.deliver_all()
+                        async for message in pubsub.listen():
+                            if message["type"] == "message":
+                                self.deliver(json.loads(message["data"]))
+            except (redis.RedisError, OSError):
+                logger.warning("Notification push listener lost Redis", exc_info=True)
+                await asyncio.sleep(1)
+
+
+BROKERS = {"local": LocalBroker, "redis": RedisBroker}
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            name = settings.REALTIME_BROKER
+            cls = BROKERS[name] if name in BROKERS else import_string(name)
+            _broker = cls()
+    return _broker
+
+
+def publish(user_ids):
+    """
+    Wake up the streams of ``user_ids``; call it after commit. Best effort:
+    clients that miss a push still catch up on their next wakeup or reconnect.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    try:
+        get_broker().publish(user_ids)
+    except Exception:
+        logger.exception("Notification push failed")
+
+
+@contextmanager
+def subscribe(user_id):
+    """``with subscribe(user_id) as subscription:`` inside an async view."""
+    broker = get_broker()
+    subscription = broker.subscribe(user_id)
+    try:
+        yield subscription
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,105 @@
+from .models import CustomUser, PostLike
+
+
+class ViewerRelations:
+    """
+    Answers "did the viewer like this post", "does the viewer follow this
+    user" and "does this user follow the viewer" for a whole serialized page
+    with one set query per relation.
+    One instance lives on each request, see get_viewer_relations().
+    """
+
+    def __init__(self, user):
+        self.user = user if user is not None and user.is_authenticated else None
+        self._liked = {}
+        self._following = {}
+        self._followed_by = {}
+
+    def load_likes(self, post_ids):
+        missing = {pk for pk in post_ids if pk not in self._liked}
+        if not missing:
+            return
+        liked = set()
+        if self.user is not None:
+            liked = set(self._liked_ids(missing))
+        for pk in missing:
+            self._liked[pk] = pk in liked
+
+    async def aload_likes(self, post_ids):
+        """load_likes for async views; the sync lookups then hit this cache."""
+        missing = {pk for pk in post_ids if pk not in self._liked}
+        if not missing:
+            return
+        liked = set()
+        if self.user is not None:
+            liked = {pk async for pk in self._liked_ids(missing)}
+        for pk in missing:
+            self._liked[pk] = pk in liked
+
+    def _liked_ids(self, post_ids):
+        return PostLike.objects.filter(
+            user_id=self.user.id, post_id__in=post_ids
+        ).values_list("post_id", flat=True)
+
+    def load_following(self, user_ids):
+        missing = {pk for pk in user_ids if pk not in self._following}
+        if not missing:
+            return
+        following = set()
+        if self.user is not None:
+            following = set(self._following_ids(missing))
+        for pk in missing:
+            self._following[pk] = pk in following
+
+    async def aload_following(self, user_ids):
+        missing = {pk for pk in user_ids if pk not in self._following}
+        if not missing:
+            return
+        following = set()
+        if self.user is not None:
+            following = {pk async for pk in self._following_ids(missing)}
+        for pk in missing:
+            self._following[pk] = pk in following
+
+    def _following_ids(self, user_ids):
+        return CustomUser.followers.through.objects.filter(
+            to_customuser_id=self.user.id, from_customuser_id__in=user_ids
+        ).values_list("from_customuser_id", flat=True)
+
+    def load_followed_by(self, user_ids):
+        missing = {pk for pk in user_ids if pk not in self._followed_by}
+        if not missing:
+            return
+        followers = set()
+        if self.user is not None:
+            followers = set(
+                CustomUser.followers.through.objects.filter(
+                    from_customuser_id=self.user.id, to_customuser_id__in=missing
+                ).values_list("to_customuser_id", flat=True)
+            )
+        for pk in missing:
+            self._followed_by[pk] = pk in followers
+
+    def is_liked(self, post):
+        self.load_likes([post.id])
+        return self._liked[post.id]
+
+    def is_following(self, user):
+        self.load_following([user.id])
+        return self._following[user.id]
+
+    def is_followed_by(self, user):
+        self.load_followed_by([user.id])
+        return self._followed_by[user.id]
+
+
+def get_viewer_relations(context):
+    request = context.get("request")
+    if request is None:
+        return ViewerRelations(None)
+
+    relations = getattr(request, "_viewer_relations", None)
+    if relations is None:
+        relations = ViewerRelations(request.user)
+        request._viewer_relations = relations
+    return relations
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.functions import Lower
+from .models import CustomUser
+
+AUTOCOMPLETE_FIELDS = (
+    "id",
+    "username",
+    "first_name",
+    "last_name",
+    "avatar",
+    "avatar_color",
+    "followers_count",
+)
+
+# Substring matches need three characters for the trigram index to help
+INFIX_MIN_LENGTH = 3
+
+
+def username_prefix(queryset, prefix):
+    """
+    Users whose lowercased username starts with ``prefix`` (already lowercase).
+    Postgres serves LIKE 'prefix%' from a text_pattern_ops index; elsewhere
+    the same LOWER(username) index answers a range scan.
+    """
+    queryset = queryset.alias(username_lower=Lower("username"))
+    if connection.vendor == "postgresql":
+        queryset = queryset.filter(username_lower__startswith=prefix)
+    else:
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        queryset = queryset.filter(username_lower__gte=prefix, username_lower__lt=upper)
+    return queryset.order_by("username_lower")
+
+
+def autocomplete(query, limit):
+    """
+    Up to ``limit`` active users for the search box: username prefix matches
+    ranked by followers, then (Postgres only) substring matches from the
+    trigram index. Results are cached for AUTOCOMPLETE_CACHE_TTL seconds.
+    """
+    query = query.strip().lower()
+    if not query:
+        return []
+
+    key = f"autocomplete:{limit}:{query}"
+    users = cache.get(key)
+    if users is not None:
+        return users
+
+    active = CustomUser.objects.filter(is_active=True).only(*AUTOCOMPLETE_FIELDS)
+    # Every prefix match is ranked, so the most followed one always makes it.
+    # The cost grows with the matches (a short prefix of a big table reads
+    # many rows before the top-N sort); the cache absorbs repeated queries.
+    ranked = username_prefix(active, query).order_by(
+        "-followers_count", "username_lower"
+    )
+    users = list(ranked[:limit])
+
+    if (
+        len(users) < limit
+        and len(query) >= INFIX_MIN_LENGTH
+        and connection.vendor == "postgresql"
+    ):
+        infix = (
+            active.filter(username__icontains=query)
+            .exclude(pk__in=[user.pk for user in users])
+            .order_by("-followers_count", "id")
+        )
+        users += list(infix[: limit - len(users)])
+
+    cache.set(key, users, getattr(settings, "AUTOCOMPLETE_CACHE_TTL", 30))
+    return users
@@ -1,11 +1,36 @@
+import os
 from rest_framework import serializers
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema_field
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.contrib.auth.password_validation import validate_password
-from .models import CustomUser, Post, Comment, Notification
+from django.core.files.storage import default_storage
+from .models import (
+    CustomUser,
+    Post,
+    Comment,
+    Notification,
+    UploadSession,
+    Hashtag,
+    FollowSuggestion,
+)
+from .relations import get_viewer_relations
+from .images import variant_urls
 
 User = get_user_model()
 
+RELATIONSHIPS_MAX_IDS = 200
+
+
+class ViewerRelationsListSerializer(serializers.ListSerializer):
+    """Resolves is_liked / is_following for the whole page before serializing it."""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, "all") else data)
+        self.child.load_relations(get_viewer_relations(self.context), items)
+        return super().to_representation(items)
+
 
 class CustomUserListSerializer(serializers.ModelSerializer):
     class Meta:
@@ -34,25 +59,82 @@ class CustomUserDetailSerializer(serializers.ModelSerializer):
             "is_following",
             "created_at",
         ]
+        list_serializer_class = ViewerRelationsListSerializer
+
+    def load_relations(self, relations, users):
+        relations.load_following([user.id for user in users])
 
     @extend_schema_field(serializers.BooleanField)
     def get_is_following(self, obj):
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return obj.followers.filter(id=request.user.id).exists()
-        return False
+        return get_viewer_relations(self.context).is_following(obj)
+
+
+@extend_schema_field(OpenApiTypes.OBJECT)
+class ImageVariantsField(serializers.ReadOnlyField):
+    """{"thumb": {"jpeg": url, "webp": url}, ...}; empty until the worker renders them."""
+
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get("request"))
 
 
 class FeedAuthorSerializer(serializers.ModelSerializer):
+    avatar_variants = ImageVariantsField()
+
+    class Meta:
+        model = CustomUser
+        fields = ["id", "username", "avatar", "avatar_variants", "avatar_color"]
+
+
+class UserAutocompleteSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
-        fields = ["id", "username", "avatar"]
+        fields = [
+            "id",
+            "username",
+            "first_name",
+            "last_name",
+            "avatar",
+            "avatar_color",
+            "followers_count",
+        ]
+
+
+class RelationshipsQuerySerializer(serializers.Serializer):
+    ids = serializers.CharField()
+
+    def validate_ids(self, value):
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in value.split(",") if pk.strip()))
+        except ValueError:
+            raise serializers.ValidationError("ids - utir menen ajiratilgan sanlar")
+        if not ids:
+            raise serializers.ValidationError("ids bos")
+        if len(ids) > RELATIONSHIPS_MAX_IDS:
+            raise serializers.ValidationError(
+                f"Bir soraw ushin {RELATIONSHIPS_MAX_IDS} id dan kop emes"
+            )
+        return ids
+
+
+class RelationshipSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    following = serializers.BooleanField()
+    followed_by = serializers.BooleanField()
+
+
+class FollowSuggestionSerializer(serializers.ModelSerializer):
+    user = CustomUserListSerializer(source="suggested", read_only=True)
+
+    class Meta:
+        model = FollowSuggestion
+        fields = ["user", "mutuals", "score"]
 
 
 class FeedPostSerializer(serializers.ModelSerializer):
     author = FeedAuthorSerializer(read_only=True)
     likes_count = serializers.IntegerField(read_only=True)
     comments_count = serializers.IntegerField(read_only=True)
+    image_variants = ImageVariantsField()
     is_liked = serializers.SerializerMethodField()
 
     class Meta:
@@ -61,18 +143,32 @@ class FeedPostSerializer(serializers.ModelSerializer):
             "id",
             "author",
             "image",
+            "image_variants",
+            "image_width",
+            "image_height",
+            "image_size",
+            "image_color",
+            "image_placeholder",
             "caption",
             "created_at",
             "likes_count",
             "comments_count",
             "is_liked",
         ]
+        list_serializer_class = ViewerRelationsListSerializer
+
+    def load_relations(self, relations, posts):
+        relations.load_likes([post.id for post in posts])
 
+    @extend_schema_field(serializers.BooleanField)
     def get_is_liked(self, obj):
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return obj.likes.filter(id=request.user.id).exists()
-        return False
+        return get_viewer_relations(self.context).is_liked(obj)
+
+
+class HashtagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Hashtag
+        fields = ["name", "posts_count", "created_at"]
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -96,6 +192,8 @@ class NotificationSerializer(serializers.ModelSerializer):
             "type",
             "post_image",
             "message",
+            "actors_count",
+            "recent_actors",
             "is_read",
             "created_at",
         ]
@@ -103,24 +201,38 @@ class NotificationSerializer(serializers.ModelSerializer):
     @extend_schema_field(serializers.CharField)
     def get_post_image(self, obj):
         if obj.post and obj.post.image:
+            thumb = obj.post.image_variants.get("thumb")
+            if thumb:
+                return default_storage.url(thumb["jpeg"])
             return obj.post.image.url
         return None
 
     @extend_schema_field(serializers.CharField)
     def get_message(self, obj):
+        actors = obj.sender.username
+        if obj.actors_count > 1:
+            actors = f"{actors} ham basqa {obj.actors_count - 1} adam"
+
         if obj.type == "like":
-            return f"{obj.sender.username} senin postina like basti"
+            return f"{actors} senin postina like basti"
         elif obj.type == "comment":
-            return f"{obj.sender.username} senin postina kommentariya jazdi"
+            return f"{actors} senin postina kommentariya jazdi"
         elif obj.type == "follow":
-            return f"{obj.sender.username} sagan follow etti"
+            return f"{actors} sagan follow etti"
         return "Jana xabar"
 
 
+class MarkReadSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=500
+    )
+
+
 class PostSerializer(serializers.ModelSerializer):
     author = FeedAuthorSerializer(read_only=True)
-    likes_count = serializers.IntegerField(source="likes.count", read_only=True)
-    comments_count = serializers.IntegerField(source="comments.count", read_only=True)
+    likes_count = serializers.IntegerField(read_only=True)
+    comments_count = serializers.IntegerField(read_only=True)
+    image_variants = ImageVariantsField()
     is_liked = serializers.SerializerMethodField()
 
     class Meta:
@@ -129,6 +241,12 @@ class PostSerializer(serializers.ModelSerializer):
             "id",
             "author",
             "image",
+            "image_variants",
+            "image_width",
+            "image_height",
+            "image_size",
+            "image_color",
+            "image_placeholder",
             "caption",
             "created_at",
             "likes_count",
@@ -136,13 +254,38 @@ class PostSerializer(serializers.ModelSerializer):
             "is_liked",
         ]
         read_only_fields = ["created_at"]
+        list_serializer_class = ViewerRelationsListSerializer
 
-    @extend_schema_field(serializers.CharField)
+    def load_relations(self, relations, posts):
+        relations.load_likes([post.id for post in posts])
+
+    @extend_schema_field(serializers.BooleanField)
     def get_is_liked(self, obj):
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return obj.likes.filter(id=request.user.id).exists()
-        return False
+        return get_viewer_relations(self.context).is_liked(obj)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ["id", "filename", "size", "offset", "created_at", "expires_at"]
+        read_only_fields = ["offset", "created_at", "expires_at"]
+
+    def validate_filename(self, value):
+        value = os.path.basename(value)
+        if not value:
+            raise serializers.ValidationError("Fayl ati bos")
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Fayl kolemi 1 ham {settings.UPLOAD_MAX_SIZE} bayt araliginda boliwi kerek"
+            )
+        return value
+
+
+class UploadFinalizeSerializer(serializers.Serializer):
+    caption = serializers.CharField(max_length=2000, required=False, allow_blank=True)
 
 
 class RegisterSerializer(serializers.ModelSerializer):
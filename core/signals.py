@@ -1,44 +1,200 @@
-from django.db.models.signals import m2m_changed, post_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
-from .models import Post, Comment, CustomUser, Notification
+from django.utils import timezone
+from .models import Post, Comment, CustomUser, TimelineEntry, UploadSession
+from .counters import bump
+from .outbox import enqueue
+from . import authentication, hashtags, images, profile_cache, uploads
+
+# Notifications and timelines are derived state: the handlers below only
+# record outbox events, which `manage.py outbox_worker` applies later.
 
 
 @receiver(post_save, sender=Comment)
 def create_comment_notification(sender, instance, created, **kwargs):
     if created:
-        if instance.user != instance.post.author:
-            Notification.objects.create(
-                sender=instance.user,
-                receiver=instance.post.author,
-                type="comment",
-                post=instance.post,
-                is_read=False,
-            )
+        enqueue("comment", comment_id=instance.pk)
 
 
 @receiver(m2m_changed, sender=Post.likes.through)
-def create_like_notification(sender, instance, action, pk_set, **kwargs):
-    if action == "post_add":
-        for user_id in pk_set:
-            liker = CustomUser.objects.get(pk=user_id)
-            if liker != instance.author:
-                Notification.objects.get_or_create(
-                    sender=liker,
-                    receiver=instance.author,
-                    type="like",
-                    post=instance,
-                    defaults={"is_read": False},
-                )
+def create_like_notification(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add" or not pk_set:
+        return
+    if reverse:
+        pairs = [[post_id, instance.pk] for post_id in pk_set]
+    else:
+        pairs = [[instance.pk, user_id] for user_id in pk_set]
+    enqueue("like", pairs=pairs)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        enqueue("post_created", post_id=instance.pk)
+
+
+def _store_upload_dimensions(instance, prefix):
+    # Color and placeholder follow from the variants worker
+    dimensions = images.upload_dimensions(getattr(instance, prefix))
+    if dimensions is not None:
+        for key, value in dimensions.items():
+            setattr(instance, f"{prefix}_{key}", value)
+        setattr(instance, f"{prefix}_color", "")
+        setattr(instance, f"{prefix}_placeholder", "")
+
+
+@receiver(pre_save, sender=Post)
+def store_post_image_dimensions(sender, instance, **kwargs):
+    _store_upload_dimensions(instance, "image")
+
+
+@receiver(pre_save, sender=CustomUser)
+def store_avatar_dimensions(sender, instance, **kwargs):
+    _store_upload_dimensions(instance, "avatar")
+
+
+@receiver(post_save, sender=Post)
+def sync_hashtags(sender, instance, created, update_fields, **kwargs):
+    if update_fields is not None and "caption" not in update_fields:
+        return
+    if created and not hashtags.extract(instance.caption):
+        return
+    hashtags.sync_posts([instance])
+
+
+@receiver(pre_delete, sender=Post)
+def forget_hashtags(sender, instance, **kwargs):
+    hashtags.forget_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def queue_post_image_variants(sender, instance, **kwargs):
+    if images.needs_variants(instance.image, instance.image_variants):
+        enqueue("image_variants", target="post", pk=instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+def queue_avatar_variants(sender, instance, **kwargs):
+    if images.needs_variants(instance.avatar, instance.avatar_variants):
+        enqueue("image_variants", target="avatar", pk=instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_profile(sender, instance, **kwargs):
+    # Counter changes go through counters.bump(), which invalidates as well
+    profile_cache.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def revoke_cached_user(sender, instance, **kwargs):
+    # Password changes, deactivation and profile edits; counters and image
+    # metadata are not cached (core/authentication.py)
+    authentication.revoke([instance.pk])
 
 
 @receiver(m2m_changed, sender=CustomUser.followers.through)
-def create_follow_notification(sender, instance, action, pk_set, **kwargs):
-    if action == "post_add":
-        for follower_id in pk_set:
-            follower_user = CustomUser.objects.get(pk=follower_id)
-            Notification.objects.get_or_create(
-                sender=follower_user,
-                receiver=instance,
-                type="follow",
-                post=None,
-                defaults={"is_read": False},)
+def sync_follow(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse=False: instance.followers changed, reverse=True: instance.following
+    if action in ("post_add", "post_remove") and pk_set:
+        if reverse:
+            pairs = [[author_id, instance.pk] for author_id in pk_set]
+        else:
+            pairs = [[instance.pk, follower_id] for follower_id in pk_set]
+        enqueue("follow" if action == "post_add" else "unfollow", pairs=pairs)
+    elif action == "post_clear":
+        if reverse:
+            TimelineEntry.objects.filter(user=instance).delete()
+        else:
+            TimelineEntry.objects.filter(author=instance).delete()
+
+
+def _linked_ids(through, source, target, instance, pk_set):
+    # Rows that really exist, so remove/clear never decrement for missing links
+    rows = through.objects.filter(**{f"{source}_id": instance.pk})
+    if pk_set is not None:
+        rows = rows.filter(**{f"{target}_id__in": pk_set})
+    return set(rows.values_list(f"{target}_id", flat=True))
+
+
+def _changed_ids(through, source, target, instance, action, pk_set, stash):
+    """Return (ids, +1/-1) for a finished m2m change, or (None, 0) otherwise."""
+    if action in ("pre_remove", "pre_clear"):
+        setattr(instance, stash, _linked_ids(through, source, target, instance, pk_set))
+    elif action == "post_add":
+        return pk_set, 1
+    elif action in ("post_remove", "post_clear"):
+        return instance.__dict__.pop(stash, set()), -1
+    return None, 0
+
+
+def _engaged():
+    # Posts whose counters moved; update_explore_scores reads only these
+    return {"engaged_at": timezone.now()}
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def update_like_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    source, target = ("user", "post") if reverse else ("post", "user")
+    ids, sign = _changed_ids(
+        sender, source, target, instance, action, pk_set, "_like_counter_ids"
+    )
+    if not ids:
+        return
+    if reverse:
+        bump(Post, ids, _engaged(), likes_count=sign)
+    else:
+        bump(Post, [instance.pk], _engaged(), likes_count=sign * len(ids))
+
+
+@receiver(m2m_changed, sender=CustomUser.followers.through)
+def update_follow_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        source, target = "to_customuser", "from_customuser"
+    else:
+        source, target = "from_customuser", "to_customuser"
+    ids, sign = _changed_ids(
+        sender, source, target, instance, action, pk_set, "_follow_counter_ids"
+    )
+    if not ids:
+        return
+    if reverse:
+        bump(CustomUser, [instance.pk], following_count=sign * len(ids))
+        bump(CustomUser, ids, followers_count=sign)
+    else:
+        bump(CustomUser, [instance.pk], followers_count=sign * len(ids))
+        bump(CustomUser, ids, following_count=sign)
+
+
+@receiver(post_save, sender=Post)
+def increment_posts_count(sender, instance, created, **kwargs):
+    if created:
+        bump(CustomUser, [instance.author_id], posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def decrement_posts_count(sender, instance, **kwargs):
+    bump(CustomUser, [instance.author_id], posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, **kwargs):
+    if created:
+        bump(Post, [instance.post_id], _engaged(), comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, **kwargs):
+    bump(Post, [instance.post_id], _engaged(), comments_count=-1)
+
+
+@receiver(post_delete, sender=UploadSession)
+def remove_upload_file(sender, instance, **kwargs):
+    uploads.discard(instance)
@@ -1 +1,1209 @@
-from django.test import TestCase  # noqa
+import asyncio
+import io
+import json
+import random
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlsplit
+from asgiref.sync import async_to_sync, sync_to_async
+import fakeredis
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.http import Http404
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import (
+    Comment,
+    CustomUser,
+    Hashtag,
+    Notification,
+    OutboxEvent,
+    Post,
+    PostHashtag,
+    PostLike,
+    PostScore,
+    TimelineEntry,
+)
+from .likes import toggle_like
+from .pagination import KeysetPagination
+from .views import NotificationViewSet
+from . import (
+    async_views,
+    authentication,
+    explore,
+    hashtags,
+    images,
+    likes,
+    notifications,
+    outbox,
+    realtime,
+    timeline,
+)
+
+
+def make_user(username, **extra):
+    return CustomUser.objects.create_user(username, password="pw12345678x", **extra)
+
+
+def make_post(author, caption=""):
+    # Variants marked as rendered: there is no file behind the image
+    return Post.objects.create(
+        author=author,
+        image="posts/test.jpg",
+        image_variants={"source": "posts/test.jpg"},
+        caption=caption,
+    )
+
+
+@override_settings(OUTBOX_EAGER=False, TIMELINE_MAX_LENGTH=3)
+class TimelineTests(TestCase):
+    def test_trim_cuts_timelines_back_to_the_cap(self):
+        author, follower = make_user("author"), make_user("follower")
+        reader = make_user("reader")
+        author.followers.add(follower, reader)
+        posts = [make_post(author) for _ in range(5)]
+        for post in posts:
+            timeline.fan_out_post(post)
+        # Fan-out only appends
+        self.assertEqual(TimelineEntry.objects.filter(user=follower).count(), 5)
+        TimelineEntry.objects.filter(user=reader).exclude(post=posts[0]).delete()
+
+        call_command("rebuild_timelines", "--trim", stdout=io.StringIO())
+        kept = TimelineEntry.objects.filter(user=follower).order_by(
+            "-created_at", "-id"
+        )
+        self.assertEqual(
+            list(kept.values_list("post_id", flat=True)),
+            [post.id for post in reversed(posts[-3:])],
+        )
+        self.assertEqual(list(timeline.overflowing()), [])
+        self.assertTrue(TimelineEntry.objects.filter(user=reader).exists())
+
+
+@override_settings(OUTBOX_EAGER=False)
+class NotificationSinceTests(TestCase):
+    def setUp(self):
+        self.receiver, self.sender = make_user("receiver"), make_user("sender")
+        self.post = make_post(self.receiver)
+        self.client = APIClient()
+        self.client.force_authenticate(self.receiver)
+        self.start = timezone.now()
+
+    def notify(self, minutes, kind="comment"):
+        notification = Notification.objects.create(
+            sender=self.sender,
+            receiver=self.receiver,
+            post=self.post,
+            type=kind,
+            is_read=False,
+        )
+        self.bump(notification, minutes)
+        return notification
+
+    def bump(self, notification, minutes):
+        # What coalesce() does to a row that gets another actor
+        Notification.objects.filter(pk=notification.pk).update(
+            created_at=self.start + timedelta(minutes=minutes)
+        )
+
+    def since(self, cursor=None):
+        params = {"since": cursor} if cursor else {}
+        return self.client.get("/api/notifications/since/", params)
+
+    def test_coalesced_row_does_not_hide_newer_rows(self):
+        seen = self.notify(1, "like")
+        response = self.since()
+        self.assertEqual([row["id"] for row in response.data["results"]], [seen.id])
+        cursor = parse_qs(urlsplit(response.data["next"]).query)["since"][0]
+
+        created = self.notify(2)
+        self.bump(seen, 3)
+        response = self.since(cursor)
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]], [created.id, seen.id]
+        )
+
+    def test_bare_id_is_rejected(self):
+        seen = self.notify(1)
+        self.assertEqual(self.since(str(seen.id)).status_code, 404)
+
+
+@override_settings(OUTBOX_EAGER=False)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user("reader")
+        self.post = make_post(self.user)
+        now = timezone.now()
+        for i in range(25):
+            comment = Comment.objects.create(user=self.user, post=self.post, text="x")
+            # Pairs share created_at, so the id tiebreak is exercised too
+            Comment.objects.filter(pk=comment.pk).update(
+                created_at=now - timedelta(minutes=i // 2)
+            )
+        self.expected = list(
+            Comment.objects.filter(post=self.post)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor_round_trip(self):
+        url = f"/api/posts/{self.post.id}/comments/"
+        pages = [self.get(url, pagination="cursor", page_size=10)]
+        while pages[-1]["next"]:
+            pages.append(self.get(pages[-1]["next"]))
+        ids = [row["id"] for page in pages for row in page["results"]]
+        self.assertEqual(ids, self.expected)
+        self.assertNotIn("count", pages[0])
+        self.assertIsNone(pages[0]["previous"])
+
+        # previous from the last page returns the page before it
+        back = self.get(pages[-1]["previous"])
+        self.assertEqual(back["results"], pages[-2]["results"])
+
+    def test_page_numbers_unchanged(self):
+        data = self.get(f"/api/posts/{self.post.id}/comments/", page=2)
+        self.assertEqual(data["count"], 25)
+        self.assertEqual([row["id"] for row in data["results"]], self.expected[10:20])
+
+    def test_other_lists_keep_page_number_pagination(self):
+        Hashtag.objects.create(name="tag")
+        data = self.get("/api/tags/", pagination="cursor")
+        self.assertEqual(data["count"], 1)
+
+
+@override_settings(OUTBOX_EAGER=False)
+class FollowListTests(TestCase):
+    def test_lists_are_ordered_by_follow_time(self):
+        author = make_user("author")
+        fans = [make_user(f"fan{i}") for i in range(3)]
+        # Accounts created in one order, follows made in the reverse one
+        for fan in reversed(fans):
+            author.followers.add(fan)
+            fan.followers.add(author)
+        client = APIClient()
+        client.force_authenticate(author)
+
+        followers = client.get(f"/api/users/{author.id}/followers/").data
+        self.assertEqual(
+            [row["id"] for row in followers["results"]], [fan.id for fan in fans]
+        )
+        following = client.get(f"/api/users/{author.id}/following/").data
+        self.assertEqual(
+            [row["id"] for row in following["results"]], [fan.id for fan in fans]
+        )
+
+    def test_cursor_pages_do_not_shift_on_a_new_follow(self):
+        author = make_user("author")
+        fans = [make_user(f"fan{i}") for i in range(5)]
+        for fan in fans:
+            author.followers.add(fan)
+        client = APIClient()
+        client.force_authenticate(author)
+        url = f"/api/users/{author.id}/followers/"
+
+        first = client.get(url, {"pagination": "cursor", "page_size": 2}).data
+        self.assertEqual(
+            [row["id"] for row in first["results"]], [fans[4].id, fans[3].id]
+        )
+        # A new follower lands on top, the next page goes on below fan3
+        author.followers.add(make_user("late"))
+        seen = [row["id"] for row in first["results"]]
+        link = first["next"]
+        while link:
+            page = client.get(link).data
+            seen += [row["id"] for row in page["results"]]
+            link = page["next"]
+        self.assertEqual(seen, [fan.id for fan in reversed(fans)])
+        self.assertEqual(client.get(url, {"cursor": "MXxub3Q="}).status_code, 404)
+
+
+def run_outbox():
+    for event_id in outbox.pending_ids(100):
+        outbox.process_event(event_id)
+
+
+@override_settings(OUTBOX_EAGER=False)
+class CoalescedNotificationTests(TestCase):
+    def setUp(self):
+        self.author = make_user("author")
+        self.post = make_post(self.author)
+        self.fans = [make_user(f"fan{i}") for i in range(5)]
+
+    def notification(self):
+        return Notification.objects.get(receiver=self.author, type="like")
+
+    def test_relike_after_dropping_out_of_recent_actors_does_not_drift(self):
+        for fan in self.fans:
+            toggle_like(self.post.id, fan.id)
+        run_outbox()
+        self.assertEqual(self.notification().actors_count, 5)
+
+        # fans[0] is no longer among the three recent actors
+        toggle_like(self.post.id, self.fans[0].id)
+        toggle_like(self.post.id, self.fans[0].id)
+        run_outbox()
+        notification = self.notification()
+        self.assertEqual(notification.actors_count, 5)
+        self.assertEqual(notification.recent_actors[0], self.fans[0].id)
+
+        # An unlike is reflected the next time the row is coalesced
+        toggle_like(self.post.id, self.fans[1].id)
+        toggle_like(self.post.id, self.fans[2].id)
+        toggle_like(self.post.id, self.fans[2].id)
+        run_outbox()
+        self.assertEqual(self.notification().actors_count, 4)
+
+    def test_reconcile_repairs_actors_count(self):
+        for fan in self.fans[:3]:
+            toggle_like(self.post.id, fan.id)
+        self.author.followers.add(*self.fans)
+        run_outbox()
+        Notification.objects.update(actors_count=42)
+
+        call_command("reconcile_counters", stdout=io.StringIO())
+        counts = dict(Notification.objects.values_list("type", "actors_count"))
+        self.assertEqual(counts, {"like": 3, "follow": 5})
+
+
+@override_settings(OUTBOX_EAGER=False)
+class HashtagTests(TestCase):
+    def test_names_too_long_after_casefold_are_skipped(self):
+        fits, grows = "ß" * 50, "ß" * 51
+        self.assertEqual(hashtags.extract(f"#{fits} #{grows} #Ok"), {"ss" * 50, "ok"})
+
+    def test_resaving_a_post_counts_each_tag_once(self):
+        post = make_post(make_user("author"), "#sun #fun")
+        post.save()
+        hashtags.sync_posts([post])
+        post.caption = "#sun"
+        post.save()
+        counts = dict(Hashtag.objects.values_list("name", "posts_count"))
+        self.assertEqual(counts, {"sun": 1, "fun": 0})
+
+
+@override_settings(OUTBOX_EAGER=False)
+class ExploreScoreTests(TestCase):
+    def test_unlike_removes_the_weight_the_like_added(self):
+        author, fan, other = make_user("author"), make_user("fan"), make_user("other")
+        unliked, liked = make_post(author), make_post(author)
+        for post in (unliked, liked):
+            toggle_like(post.pk, fan.pk)
+        toggle_like(unliked.pk, other.pk)
+        explore.update_scores(explore.EPOCH)
+
+        # Two days later the same like weighs four times as much
+        toggle_like(unliked.pk, other.pk)
+        later = timezone.now() + timedelta(days=2)
+        with mock.patch.object(explore.timezone, "now", return_value=later):
+            explore.update_scores(explore.EPOCH)
+
+        scores = dict(PostScore.objects.values_list("post_id", "score"))
+        self.assertAlmostEqual(scores[unliked.pk], scores[liked.pk], places=3)
+
+    @override_settings(EXPLORE_TOP_CACHE_TTL=60)
+    def test_cached_top_list_expires(self):
+        cache.delete(explore.TOP_KEY)
+        author, fan = make_user("author"), make_user("fan")
+        old, new = make_post(author), make_post(author)
+        toggle_like(old.pk, fan.pk)
+        explore.update_scores(explore.EPOCH)
+        self.assertEqual(explore.top_ids(), [old.pk])
+
+        # Scored by the command in another process: this cache is not told
+        toggle_like(new.pk, fan.pk)
+        explore.update_scores(explore.EPOCH)
+        self.assertEqual(explore.top_ids(), [old.pk])
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertEqual(set(explore.top_ids()), {old.pk, new.pk})
+
+
+class UploadChunkTests(TestCase):
+    def test_malformed_content_length_is_a_bad_request(self):
+        user = make_user("uploader")
+        client = APIClient()
+        client.force_authenticate(user)
+        session = client.post(
+            "/api/uploads/", {"filename": "a.jpg", "size": 4}, format="json"
+        ).data
+        for header in ("abc", "-4"):
+            with self.subTest(header=header):
+                response = client.put(
+                    f"/api/uploads/{session['id']}/chunk/",
+                    b"data",
+                    content_type="application/octet-stream",
+                    HTTP_CONTENT_RANGE="bytes 0-3/4",
+                    CONTENT_LENGTH=header,
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class StreamTicketTests(TestCase):
+    def setUp(self):
+        self.user = make_user("viewer")
+        self.client = APIClient()
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_ticket_works_once(self):
+        response = self.client.post("/api/notifications/stream-ticket/")
+        ticket = response.data["ticket"]
+        user, claims = async_to_sync(async_views.authenticate_ticket)(ticket)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(claims["token_type"], "access")
+        with self.assertRaises(AuthenticationFailed):
+            async_to_sync(async_views.authenticate_ticket)(ticket)
+
+    def test_stream_resumes_from_a_cursor_only(self):
+        notification = Notification.objects.create(
+            sender=make_user("sender"), receiver=self.user, type="follow", is_read=False
+        )
+        cursor = KeysetPagination().make_cursor(notification)
+        queryset = Notification.objects.filter(receiver=self.user)
+        factory = APIRequestFactory()
+
+        def position(**params):
+            request = Request(factory.get("/", params))
+            return async_to_sync(async_views.stream_position)(request, queryset)
+
+        expected = (notification.created_at, notification.pk)
+        self.assertEqual(position(since=cursor), expected)
+        with self.assertRaises(NotFound):
+            position(since=str(notification.pk))
+
+
+@override_settings(OUTBOX_EAGER=False)
+class LikeToggleTests(TestCase):
+    def setUp(self):
+        self.author, self.fan = make_user("author"), make_user("fan")
+        self.post = make_post(self.author)
+        self.client = APIClient()
+
+    def like(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.post(f"/api/posts/{self.post.pk}/like/")
+        run_outbox()
+        return response.data
+
+    def test_toggle_updates_the_counter_and_notifies_the_author(self):
+        self.assertEqual(self.like(self.fan), {"status": "liked", "likes_count": 1})
+        self.assertTrue(PostLike.objects.filter(post=self.post, user=self.fan).exists())
+        notification = Notification.objects.get(receiver=self.author, type="like")
+        self.assertEqual(
+            (notification.sender, notification.actors_count), (self.fan, 1)
+        )
+
+        self.assertEqual(self.like(self.fan), {"status": "Unliked", "likes_count": 0})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertFalse(PostLike.objects.exists())
+
+    def test_like_on_a_deleted_post_is_not_found(self):
+        post_id = self.post.pk
+        self.post.delete()
+        with self.assertRaises(Http404):
+            toggle_like(post_id, self.fan.pk)
+        self.assertFalse(PostLike.objects.exists())
+        self.assertFalse(OutboxEvent.objects.filter(kind="like").exists())
+
+    @skipUnless(connection.vendor == "postgresql", "the one-statement toggle")
+    def test_postgres_toggle_statement(self):
+        with transaction.atomic():
+            self.assertEqual(
+                likes._toggle_postgres(self.post.pk, self.fan.pk), (True, 1)
+            )
+            self.assertEqual(
+                likes._toggle_postgres(self.post.pk, self.fan.pk), (False, 0)
+            )
+            self.assertEqual(
+                likes._toggle_postgres(self.post.pk, self.fan.pk), (True, 1)
+            )
+        self.post.refresh_from_db()
+        self.assertIsNotNone(self.post.engaged_at)
+        self.assertEqual(
+            list(PostLike.objects.values_list("user_id", flat=True)), [self.fan.pk]
+        )
+
+    def test_own_like_and_undone_like_notify_nobody(self):
+        self.like(self.author)
+        self.client.force_authenticate(self.fan)
+        self.client.post(f"/api/posts/{self.post.pk}/like/")
+        self.client.post(f"/api/posts/{self.post.pk}/like/")
+        run_outbox()
+        self.assertFalse(Notification.objects.exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+
+class CachedAuthenticationTests(TestCase):
+    url = "/api/notifications/unread_count/"
+
+    def setUp(self):
+        # Ids are reused after each test's rollback, the caches are not
+        cache.clear()
+        authentication.local_users.clear()
+        self.user = make_user("member")
+        self.client = APIClient()
+
+    def authorize(self):
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        # Caches the row, in the shared cache and the local LRU
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def save_user(self):
+        # revoke() waits for the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+    def test_deactivation_revokes_the_cached_user(self):
+        self.authorize()
+        self.user.is_active = False
+        self.save_user()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["code"], "user_inactive")
+
+    # Patched: simplejwt rebinds api_settings on setting_changed, and the
+    # modules that imported it keep the old object
+    @mock.patch.object(jwt_settings, "CHECK_REVOKE_TOKEN", True)
+    def test_password_change_revokes_the_cached_user(self):
+        self.authorize()
+        self.user.set_password("another-pw-123")
+        self.save_user()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["code"], "password_changed")
+
+
+@override_settings(OUTBOX_EAGER=False, OUTBOX_MAX_ATTEMPTS=2)
+class OutboxRetryTests(TestCase):
+    def setUp(self):
+        self.failures = 0
+        patcher = mock.patch.dict(outbox.HANDLERS, {"flaky": self.flaky})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def flaky(self, name, fail):
+        # The write must roll back with the failure
+        Hashtag.objects.create(name=f"{name}{self.failures}")
+        if self.failures < fail:
+            self.failures += 1
+            raise RuntimeError("broker down")
+
+    def process(self, event):
+        with self.assertLogs("core.outbox", "ERROR"):
+            self.assertFalse(outbox.process_event(event.pk))
+        event.refresh_from_db()
+
+    def test_failed_event_is_retried_until_it_succeeds(self):
+        event = outbox.enqueue("flaky", name="tag", fail=1)
+        self.process(event)
+        self.assertEqual((event.attempts, event.processed_at), (1, None))
+        self.assertIn("broker down", event.last_error)
+        self.assertFalse(Hashtag.objects.exists())
+        self.assertEqual(outbox.pending_ids(10), [event.pk])
+
+        self.assertTrue(outbox.process_event(event.pk))
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 2)
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(list(Hashtag.objects.values_list("name", flat=True)), ["tag1"])
+        self.assertFalse(outbox.process_event(event.pk))
+
+    def test_event_is_given_up_after_max_attempts(self):
+        event = outbox.enqueue("flaky", name="tag", fail=5)
+        for _ in range(2):
+            self.process(event)
+        self.assertEqual((event.attempts, event.processed_at), (2, None))
+        self.assertEqual(outbox.pending_ids(10), [])
+
+
+@override_settings(OUTBOX_EAGER=False)
+class ViewerRelationsTests(TestCase):
+    def test_queries_per_page_do_not_grow_with_the_page(self):
+        viewer = make_user("viewer")
+        authors = [make_user(f"author{i}") for i in range(6)]
+        posts = [make_post(author) for author in authors]
+        toggle_like(posts[0].pk, viewer.pk)
+        client = APIClient()
+        client.force_authenticate(viewer)
+
+        def page(size):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get("/api/posts/", {"page_size": size})
+            return response.data["results"], len(queries)
+
+        _, small_queries = page(2)
+        full, full_queries = page(6)
+        self.assertEqual(len(full), 6)
+        self.assertEqual(full_queries, small_queries)
+        liked = {row["id"]: row["is_liked"] for row in full}
+        self.assertEqual([pk for pk, flag in liked.items() if flag], [posts[0].pk])
+
+
+@override_settings(OUTBOX_EAGER=False)
+class CounterTests(TestCase):
+    def test_counters_survive_a_full_save_of_a_stale_instance(self):
+        author, fan = make_user("author"), make_user("fan")
+        post = make_post(author, "before")
+        stale_author = CustomUser.objects.get(pk=author.pk)
+        toggle_like(post.pk, fan.pk)
+        Comment.objects.create(post=post, user=fan, text="hi")
+        author.followers.add(fan)
+
+        post.caption = "after"
+        post.save()
+        stale_author.bio = "edited"
+        stale_author.save()
+
+        post.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(
+            (post.caption, post.likes_count, post.comments_count), ("after", 1, 1)
+        )
+        self.assertIsNotNone(post.engaged_at)
+        self.assertEqual(
+            (author.bio, author.posts_count, author.followers_count), ("edited", 1, 1)
+        )
+
+
+@override_settings(OUTBOX_EAGER=False)
+class ImageTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        storage = self.settings(MEDIA_ROOT=media)
+        storage.enable()
+        self.addCleanup(storage.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user("author"))
+
+    def upload(self, data):
+        image = SimpleUploadedFile("photo.jpg", data, content_type="image/jpeg")
+        response = self.client.post(
+            "/api/posts/", {"image": image, "caption": "x"}, format="multipart"
+        )
+        return response.data
+
+    def test_worker_renders_every_variant(self):
+        post = self.upload(images.synthetic(1200, 900, seed=1))
+        self.assertEqual(post["image_variants"], {})
+        run_outbox()
+
+        data = self.client.get(f"/api/posts/{post['id']}/").data
+        stored = Post.objects.get(pk=post["id"]).image_variants
+        self.assertEqual(stored["source"], Post.objects.get(pk=post["id"]).image.name)
+        for name, size in settings.IMAGE_VARIANTS["post"].items():
+            for fmt in images.FORMATS:
+                with self.subTest(variant=name, format=fmt):
+                    self.assertTrue(
+                        data["image_variants"][name][fmt].startswith("http")
+                    )
+                    with default_storage.open(stored[name][fmt]) as file:
+                        self.assertEqual(max(Image.open(file).size), size)
+        post = Post.objects.get(pk=post["id"])
+        self.assertFalse(images.refresh_variants(post, "post"))
+
+    def test_metadata_is_stored_on_upload_and_completed_by_the_worker(self):
+        # Stored landscape, EXIF says rotate: shown as portrait
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[images.ORIENTATION_TAG] = 6
+        Image.new("RGB", (300, 200), (200, 30, 30)).save(buffer, "JPEG", exif=exif)
+        data = buffer.getvalue()
+
+        post = self.upload(data)
+        self.assertEqual(
+            [post[f"image_{key}"] for key in ("width", "height", "size", "color")],
+            [200, 300, len(data), ""],
+        )
+        run_outbox()
+        post = self.client.get(f"/api/posts/{post['id']}/").data
+        self.assertEqual((post["image_width"], post["image_height"]), (200, 300))
+        self.assertRegex(post["image_color"], r"^#[0-9a-f]{6}$")
+        self.assertTrue(post["image_placeholder"].startswith("data:image/webp;base64,"))
+
+
+@override_settings(OUTBOX_EAGER=False)
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        # Ids are reused after each test's rollback, the cache is not
+        cache.clear()
+        self.user, self.viewer = make_user("star"), make_user("viewer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        self.url = f"/api/users/{self.user.pk}/"
+
+    def profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(self.url).data
+        selects = [q["sql"] for q in queries if 'FROM "core_customuser"' in q["sql"]]
+        return data, len(selects)
+
+    def test_cached_profile_is_replaced_after_a_change(self):
+        _, misses = self.profile()
+        data, hits = self.profile()
+        self.assertEqual((misses, hits), (1, 0))
+        self.assertEqual((data["followers_count"], data["is_following"]), (0, False))
+
+        # Counters go through bump(), edits through save(): both invalidate
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"{self.url}follow/")
+        data, selects = self.profile()
+        self.assertEqual(selects, 1)
+        self.assertEqual((data["followers_count"], data["is_following"]), (1, True))
+
+        self.user.bio = "new bio"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.profile()[0]["bio"], "new bio")
+
+
+class AutocompleteTests(TestCase):
+    def test_most_followed_match_wins_however_many_match(self):
+        cache.clear()
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f"fan{i:03}", followers_count=i // 100)
+            for i in range(300)
+        )
+        CustomUser.objects.filter(username="fan299").update(followers_count=90)
+        CustomUser.objects.filter(username="fan298").update(is_active=False)
+        client = APIClient()
+        client.force_authenticate(make_user("viewer"))
+
+        response = client.get("/api/users/autocomplete/", {"q": "FAN", "limit": 3})
+        self.assertEqual(
+            [row["username"] for row in response.data], ["fan299", "fan200", "fan201"]
+        )
+
+
+@override_settings(OUTBOX_EAGER=False)
+class FollowSuggestionTests(TestCase):
+    def test_friends_of_friends_ranked_by_mutuals(self):
+        viewer, a, b = make_user("viewer"), make_user("a"), make_user("b")
+        x, y, gone = make_user("x"), make_user("y"), make_user("gone", is_active=False)
+        for followed, followers in ((a, [viewer]), (b, [viewer]), (x, [a, b])):
+            followed.followers.add(*followers)
+        y.followers.add(a)
+        gone.followers.add(a)
+        # a follows back: the viewer is two hops from itself
+        viewer.followers.add(a)
+        call_command("compute_follow_suggestions", stdout=io.StringIO())
+
+        client = APIClient()
+        client.force_authenticate(viewer)
+        rows = client.get("/api/users/suggestions/").data
+        self.assertEqual(
+            [(row["user"]["id"], row["mutuals"]) for row in rows],
+            [(x.id, 2), (y.id, 1)],
+        )
+        # Followed since the batch ran
+        y.followers.add(viewer)
+        rows = client.get("/api/users/suggestions/").data
+        self.assertEqual([row["user"]["id"] for row in rows], [x.id])
+
+
+class RelationshipTests(TestCase):
+    def test_statuses_for_many_users_in_two_queries(self):
+        viewer, friend, fan, idol = [make_user(name) for name in ("v", "f", "n", "i")]
+        friend.followers.add(viewer)
+        viewer.followers.add(friend, fan)
+        idol.followers.add(viewer)
+        client = APIClient()
+        client.force_authenticate(viewer)
+        ids = [friend.id, fan.id, idol.id, 999999, friend.id]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                "/api/users/relationships/", {"ids": ",".join(map(str, ids))}
+            )
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(
+            [
+                (row["id"], row["following"], row["followed_by"])
+                for row in response.data
+            ],
+            [
+                (friend.id, True, True),
+                (fan.id, False, True),
+                (idol.id, True, False),
+                (999999, False, False),
+            ],
+        )
+
+    def test_bad_or_too_many_ids_are_rejected(self):
+        client = APIClient()
+        client.force_authenticate(make_user("viewer"))
+        too_many = ",".join(str(pk) for pk in range(1, 202))
+        for ids in ("1,x", "", too_many):
+            with self.subTest(ids=ids[:10]):
+                response = client.get("/api/users/relationships/", {"ids": ids})
+                self.assertEqual(response.status_code, 400)
+
+
+class SeedTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        storage = self.settings(MEDIA_ROOT=media)
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+    def test_seeded_counters_match_the_rows(self):
+        # COPY on Postgres, executemany elsewhere: both must load the same rows
+        call_command(
+            "seed",
+            users=40,
+            posts=120,
+            images=2,
+            skip_derived=True,
+            stdout=io.StringIO(),
+        )
+        self.assertEqual(CustomUser.objects.count(), 40)
+        self.assertEqual(Post.objects.count(), 120)
+        self.assertTrue(PostHashtag.objects.exists())
+
+        out = io.StringIO()
+        call_command("reconcile_counters", stdout=out)
+        self.assertEqual(re.findall(r": (\d+) qatar", out.getvalue()), ["0"] * 4)
+        # Sequences were moved past the seeded ids
+        make_post(make_user("after_seed"))
+
+
+class BenchmarkTests(TransactionTestCase):
+    # The requests run on a worker thread with its own connection: rows are committed
+
+    def setUp(self):
+        cache.clear()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.baseline = f"{self.dir}/baseline.json"
+
+    def benchmark(self, **options):
+        call_command(
+            "benchmark",
+            requests=40,
+            warmup=5,
+            users=3,
+            baseline=self.baseline,
+            stdout=io.StringIO(),
+            **options,
+        )
+
+    def test_empty_database_is_refused(self):
+        with self.assertRaisesMessage(CommandError, "Baza bos"):
+            self.benchmark()
+
+    def test_reports_every_endpoint_and_flags_a_regression(self):
+        users = [make_user(f"u{index}") for index in range(3)]
+        for user in users:
+            user.followers.add(*[other for other in users if other != user])
+            make_post(user, "salem")
+
+        self.benchmark(save_baseline=True)
+        with open(self.baseline) as f:
+            results = json.load(f)
+        rows = results["endpoints"]
+        self.assertEqual(
+            set(rows), {"feed", "profile", "notifications", "like", "comment"}
+        )
+        self.assertEqual(sum(row["requests"] for row in rows.values()), 40)
+        self.assertEqual([row["errors"] for row in rows.values()], [0] * 5)
+        self.assertIsNotNone(rows["feed"]["queries"])
+
+        rows["feed"]["p95_ms"] = rows["feed"]["queries"] = 0.001
+        with open(self.baseline, "w") as f:
+            json.dump(results, f)
+        # Timing noise stays well inside a 100x tolerance, the doctored row does not
+        with self.assertRaisesMessage(CommandError, "1 regressiya: feed"):
+            self.benchmark(tolerance=10_000)
+
+
+@override_settings(OUTBOX_EAGER=False)
+class AsyncReadViewTests(TestCase):
+    # The async views must answer exactly like the sync viewsets they shadow
+
+    def setUp(self):
+        cache.clear()
+        self.viewer, self.author = make_user("viewer"), make_user("author")
+        self.author.followers.add(self.viewer)
+        self.posts = [make_post(self.author, f"post {index}") for index in range(3)]
+        for post in self.posts:
+            timeline.fan_out_post(post)
+        PostLike.objects.create(user=self.viewer, post=self.posts[1])
+        Notification.objects.create(
+            sender=self.author, receiver=self.viewer, type="follow", is_read=False
+        )
+        token = AccessToken.for_user(self.viewer)
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        self.client = APIClient()
+        self.client.credentials(**self.auth)
+        self.factory = APIRequestFactory()
+
+    def call(self, view, path, method="get", data=None, **kwargs):
+        request = getattr(self.factory, method)(path, data, format="json", **self.auth)
+        return async_to_sync(view)(request, **kwargs)
+
+    def assertSameAsSync(self, view, path, **kwargs):
+        response = self.call(view, path, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), self.client.get(path).json())
+        return json.loads(response.content)
+
+    def test_feed_and_notifications_match_the_viewsets(self):
+        feed = self.assertSameAsSync(async_views.feed, "/api/feed/?page_size=2")
+        self.assertEqual(
+            [(post["id"], post["is_liked"]) for post in feed["results"]],
+            [(self.posts[2].id, False), (self.posts[1].id, True)],
+        )
+        self.assertIsNotNone(feed["next"])
+        self.assertSameAsSync(async_views.notifications, "/api/notifications/")
+
+    def test_profile_matches_the_viewset_and_hits_the_cache(self):
+        path = f"/api/users/{self.author.pk}/"
+        for _ in range(2):
+            data = self.assertSameAsSync(async_views.profile, path, pk=self.author.pk)
+            self.assertTrue(data["is_following"])
+        response = self.call(async_views.profile, "/api/users/999999/", pk=999999)
+        self.assertEqual(response.status_code, 404)
+
+    def test_anonymous_reads_are_refused_and_writes_fall_back(self):
+        request = self.factory.get("/api/feed/")
+        response = async_to_sync(async_views.feed)(request)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("Bearer", response["WWW-Authenticate"])
+
+        path = f"/api/users/{self.viewer.pk}/"
+        response = self.call(
+            async_views.profile,
+            path,
+            "patch",
+            {"first_name": "Jana"},
+            pk=self.viewer.pk,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.viewer.refresh_from_db()
+        self.assertEqual(self.viewer.first_name, "Jana")
+
+
+class NotificationStreamTests(TransactionTestCase):
+    # Outside a test transaction, so the stream can really close its connection
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.sender = make_user("viewer"), make_user("sender")
+        self.post = make_post(self.user)
+
+    def notify(self):
+        Notification.objects.create(
+            sender=self.sender,
+            receiver=self.user,
+            type="comment",
+            post=self.post,
+            is_read=False,
+        )
+        # Drops the cached unread count and publishes once committed
+        notifications.forget_unread([self.user.id])
+
+    def test_pushes_new_rows_without_holding_a_connection_while_idle(self):
+        request = Request(APIRequestFactory().get("/api/notifications/stream/"))
+        request.user, request.auth = self.user, AccessToken.for_user(self.user)
+        view = async_views.viewset_for(NotificationViewSet, "list", request)
+        self.notify()
+
+        async def stream():
+            position = await async_views.stream_position(request, view.get_queryset())
+            events = async_views.notification_events(request, view, position)
+            received = [await anext(events)]
+            waiting = asyncio.ensure_future(anext(events))
+            await asyncio.sleep(0.1)
+            idle = closes.call_count
+            await sync_to_async(self.notify)()
+            received += [await asyncio.wait_for(waiting, 5), await anext(events)]
+            await events.aclose()
+            return received, idle
+
+        # The request thread's connection; closing the in-memory SQLite one is a no-op
+        with mock.patch.object(connection, "close", wraps=connection.close) as closes:
+            received, idle = async_to_sync(stream)()
+        self.assertEqual(idle, 1)
+        self.assertEqual(
+            [event.split("\n", 1)[0] for event in received],
+            ["event: unread_count", "event: notification", "event: unread_count"],
+        )
+        self.assertIn('"unread_count":2', received[-1])
+
+
+@override_settings(REDIS_URL="redis://push")
+class RedisBrokerTests(TestCase):
+    def test_publish_wakes_only_the_users_streams(self):
+        server = fakeredis.FakeServer()
+        sync_client = mock.patch.object(
+            realtime.redis.Redis,
+            "from_url",
+            lambda url: fakeredis.FakeRedis(server=server),
+        )
+        async_client = mock.patch.object(
+            realtime.aioredis.Redis,
+            "from_url",
+            lambda url: fakeredis.aioredis.FakeRedis(server=server),
+        )
+
+        async def run():
+            broker = realtime.RedisBroker()
+            mine, other = broker.subscribe(1), broker.subscribe(2)
+            # Once subscribed, the listener wakes every stream to recheck
+            self.assertTrue(await mine.wait(5))
+            self.assertTrue(await other.wait(5))
+            await sync_to_async(realtime.publish)([1])
+            woken = await mine.wait(5), await other.wait(0.2)
+            broker.listener.cancel()
+            try:
+                await broker.listener
+            except asyncio.CancelledError:
+                pass
+            return woken
+
+        with sync_client, async_client, mock.patch.object(realtime, "_broker", None):
+            with self.settings(REALTIME_BROKER="redis"):
+                self.assertEqual(async_to_sync(run)(), (True, False))
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRoutingTests(TransactionTestCase):
+    # replica_1 mirrors the test database, as DB_REPLICA_HOSTS sets it up;
+    # rows are committed so both aliases see them. Added in setUpClass, after
+    # the runner set up its databases: "__all__" is resolved after that.
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        if "replica_1" not in connections.settings:
+            primary = connections["default"].settings_dict
+            connections.settings["replica_1"] = {
+                **primary,
+                "TEST": {**primary["TEST"], "MIRROR": "default"},
+            }
+            cls.addClassCleanup(cls.drop_replica)
+        super().setUpClass()
+
+    @classmethod
+    def drop_replica(cls):
+        connections["replica_1"].close()
+        del connections["replica_1"]
+        del connections.settings["replica_1"]
+
+    def setUp(self):
+        cache.clear()
+        self.author, self.fan = make_user("author"), make_user("fan")
+        self.author.followers.add(self.fan)
+        self.client = APIClient()
+
+    def queries(self, method, path):
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica_1"]) as replica:
+                response = getattr(self.client, method)(path)
+        return response, len(primary), len(replica)
+
+    def test_safe_request_reads_from_the_replica(self):
+        response, primary, replica = self.queries(
+            "get", f"/api/users/{self.author.pk}/followers/"
+        )
+        self.assertEqual([row["id"] for row in response.data["results"]], [self.fan.pk])
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_pinned_client_reads_from_the_primary(self):
+        self.client.cookies[settings.REPLICA_PIN_COOKIE] = "1"
+        _, primary, replica = self.queries(
+            "get", f"/api/users/{self.author.pk}/followers/"
+        )
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_writes_and_use_primary_stay_on_the_primary(self):
+        self.client.force_authenticate(make_user("reader"))
+        response, primary, replica = self.queries(
+            "post", f"/api/users/{self.author.pk}/follow/"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((primary > 0, replica), (True, 0))
+        # The client that wrote is pinned to the primary for a while
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+        # A profile cache miss fills the cache from the primary (use_primary)
+        self.client.force_authenticate(None)
+        self.client.cookies.clear()
+        response, primary, replica = self.queries(
+            "get", f"/api/users/{self.author.pk}/"
+        )
+        self.assertEqual(response.data["followers_count"], 2)
+        self.assertEqual((primary > 0, replica), (True, 0))
+
+
+# A plan degrades when it reads a whole table or sorts instead of walking an index
+POSTGRES_BAD = {
+    "sequential scan": re.compile(r"Seq Scan on (\w+)"),
+    "sort": re.compile(r"(?:^|->)\s*Sort\b", re.MULTILINE),
+}
+SQLITE_BAD = {
+    "sequential scan": re.compile(r"\bSCAN (\w+)(?! USING)(?:\s|$)"),
+    "sort": re.compile(r"USE TEMP B-TREE FOR (?:ORDER|GROUP) BY"),
+}
+PAGE = 10
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN the queries behind the hot endpoints: they must walk an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Bulk rows skewed like real traffic; no files, no signals
+        rng = random.Random(0)
+        Follow = CustomUser.followers.through
+        ids = [
+            user.id
+            for user in CustomUser.objects.bulk_create(
+                CustomUser(username=f"qp_{i}", password="!") for i in range(200)
+            )
+        ]
+        weights = [1.0 / (rank + 1) for rank in range(len(ids))]
+        follows = {
+            (author, follower)
+            for follower in ids
+            for author in rng.choices(ids, weights, k=10)
+            if author != follower
+        }
+        Follow.objects.bulk_create(
+            [Follow(from_customuser_id=a, to_customuser_id=f) for a, f in follows]
+        )
+        posts = Post.objects.bulk_create(
+            Post(author_id=author, image="posts/seed.jpg", caption="#seed")
+            for author in rng.choices(ids, weights, k=2000)
+        )
+        Comment.objects.bulk_create(
+            Comment(user_id=rng.choice(ids), post=rng.choice(posts), text="x")
+            for _ in range(2000)
+        )
+        PostLike.objects.bulk_create(
+            (
+                PostLike(user_id=rng.choice(ids), post=rng.choice(posts))
+                for _ in range(3000)
+            ),
+            ignore_conflicts=True,
+        )
+        Notification.objects.bulk_create(
+            Notification(
+                sender_id=rng.choice(ids),
+                receiver_id=rng.choices(ids, weights)[0],
+                type="comment",
+                post=rng.choice(posts),
+                is_read=rng.random() < 0.8,
+            )
+            for _ in range(2000)
+        )
+        by_author = {}
+        for post in posts:
+            by_author.setdefault(post.author_id, []).append(post)
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=follower,
+                    post_id=post.id,
+                    author_id=author,
+                    created_at=post.created_at,
+                )
+                for author, follower in follows
+                for post in by_author.get(author, [])[:20]
+            ),
+            ignore_conflicts=True,
+        )
+        cls.hashtag = Hashtag.objects.create(name="seed")
+        PostHashtag.objects.bulk_create(
+            PostHashtag(post=post, hashtag=cls.hashtag, created_at=post.created_at)
+            for post in posts
+        )
+        cls.user_id = ids[0]
+        cls.post = Post.objects.order_by("-comments_count", "id").first()
+
+    def queries(self):
+        """The querysets the views build, by endpoint."""
+        user_id, post = self.user_id, self.post
+        position = (
+            TimelineEntry.objects.filter(user_id=user_id)
+            .order_by("-created_at", "-id")
+            .values_list("created_at", "id")[PAGE]
+        )
+        return {
+            "feed": TimelineEntry.objects.filter(user_id=user_id)
+            .select_related("post__author")
+            .order_by("-created_at", "-id")[:PAGE],
+            "feed (cursor)": TimelineEntry.objects.filter(user_id=user_id)
+            .filter(KeysetPagination().after(position, KeysetPagination.ordering))
+            .order_by("-created_at", "-id")[:PAGE],
+            "posts": Post.objects.select_related("author").order_by(
+                "-created_at", "-id"
+            )[:PAGE],
+            "profile": CustomUser.objects.filter(pk=post.author_id),
+            "profile posts": Post.objects.filter(author_id=post.author_id).order_by(
+                "-created_at", "-id"
+            )[:PAGE],
+            "comments": Comment.objects.filter(post=post).order_by(
+                "-created_at", "-id"
+            )[:PAGE],
+            "likers": PostLike.objects.filter(post=post)
+            .select_related("user")
+            .order_by("-created_at", "-id")[:PAGE],
+            "notifications": Notification.objects.filter(receiver_id=user_id)
+            .select_related("sender", "post")
+            .order_by("-created_at", "-id")[:PAGE],
+            "notifications (since)": Notification.objects.filter(
+                receiver_id=user_id
+            ).order_by("created_at", "id")[:PAGE],
+            "unread count": Notification.objects.filter(
+                receiver_id=user_id, is_read=False
+            ).values("id"),
+            "tag posts": PostHashtag.objects.filter(hashtag=self.hashtag).order_by(
+                "-created_at", "-id"
+            )[:PAGE],
+        }
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor == "postgresql":
+            bad = POSTGRES_BAD
+            # Small test tables make a seq scan cheapest; with these off the
+            # planner still picks one when no index fits, which is the regression
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("SET LOCAL enable_sort = off")
+        else:
+            bad = SQLITE_BAD
+        for name, queryset in self.queries().items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                problems = [label for label, rx in bad.items() if rx.search(plan)]
+                self.assertEqual(problems, [], f"{name}:\n{plan}")
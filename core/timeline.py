@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from .models import CustomUser, Post, TimelineEntry
+
+BATCH_SIZE = 1000
+
+
+def max_length():
+    return getattr(settings, "TIMELINE_MAX_LENGTH", 800)
+
+
+def _entry(user_id, post_id, author_id, created_at):
+    return TimelineEntry(
+        user_id=user_id, post_id=post_id, author_id=author_id, created_at=created_at
+    )
+
+
+def fan_out_post(post):
+    """
+    Write a new post into the timeline of every follower of its author.
+    Timelines may run past TIMELINE_MAX_LENGTH until the periodic
+    `rebuild_timelines --trim` cuts them back: trimming here would re-rank
+    every follower's timeline for each post.
+    """
+    follower_ids = CustomUser.followers.through.objects.filter(
+        from_customuser_id=post.author_id
+    ).values_list("to_customuser_id", flat=True)
+
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.append(_entry(follower_id, post.id, post.author_id, post.created_at))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user_id, author_ids):
+    """Copy the latest posts of newly followed authors into a timeline."""
+    posts = (
+        Post.objects.filter(author_id__in=author_ids)
+        .order_by("-created_at", "-id")
+        .values_list("id", "author_id", "created_at")[: max_length()]
+    )
+    entries = [
+        _entry(user_id, post_id, author_id, created_at)
+        for post_id, author_id, created_at in posts
+    ]
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+    trim([user_id])
+
+
+def prune(user_id, author_ids):
+    """Drop the posts of unfollowed authors from a timeline."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id__in=author_ids).delete()
+
+
+def overflowing():
+    """Ids of the users whose timeline is longer than TIMELINE_MAX_LENGTH."""
+    return (
+        TimelineEntry.objects.values("user_id")
+        .annotate(length=Count("id"))
+        .filter(length__gt=max_length())
+        .order_by("user_id")
+        .values_list("user_id", flat=True)
+    )
+
+
+def trim(user_ids):
+    """Keep only the newest TIMELINE_MAX_LENGTH entries of each timeline."""
+    overflow = (
+        TimelineEntry.objects.filter(user_id__in=user_ids)
+        .annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F("user_id"),
+                order_by=[F("created_at").desc(), F("id").desc()],
+            )
+        )
+        .filter(position__gt=max_length())
+        .values_list("id", flat=True)
+    )
+    ids = list(overflow)
+    if ids:
+        TimelineEntry.objects.filter(id__in=ids).delete()
+
+
+def rebuild(user_id):
+    """Rebuild a timeline from the follow graph."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    author_ids = CustomUser.followers.through.objects.filter(
+        to_customuser_id=user_id
+    ).values_list("from_customuser_id", flat=True)
+    backfill(user_id, author_ids)
@@ -0,0 +1,90 @@
+import os
+import re
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from .models import UploadSession
+
+# Request bodies are copied to disk in blocks of this size, never held whole
+READ_BLOCK_SIZE = 64 * 1024
+
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class SessionFile(File):
+    """
+    A finished upload on local disk. Exposing temporary_file_path() lets image
+    validation open it by path and lets FileSystemStorage move it into place
+    instead of reading it into memory and copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def expiry():
+    return timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+def part_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_ROOT, f"{session.id}.part")
+
+
+def parse_content_range(header):
+    """'bytes 0-1023/4096' -> (0, 1024, 4096), end exclusive; None if malformed."""
+    match = CONTENT_RANGE.match(header or "")
+    if match is None:
+        return None
+    first, last, total = (int(value) for value in match.groups())
+    if last < first:
+        return None
+    return first, last + 1, total
+
+
+def parse_content_length(header):
+    """'1024' -> 1024, missing -> 0; None if malformed or negative."""
+    try:
+        length = int(header or 0)
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+def write_chunk(session, stream, start, length):
+    """
+    Copy ``length`` bytes from the request stream to the session file at
+    ``start``. Returns the bytes written, which is less than ``length`` when
+    the client went away; those bytes are kept so the next chunk resumes there.
+    """
+    os.makedirs(settings.UPLOAD_SESSION_ROOT, exist_ok=True)
+    fd = os.open(part_path(session), os.O_WRONLY | os.O_CREAT, 0o600)
+    written = 0
+    try:
+        os.lseek(fd, start, os.SEEK_SET)
+        while written < length:
+            block = stream.read(min(READ_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            os.write(fd, block)
+            written += len(block)
+        os.ftruncate(fd, start + written)
+    finally:
+        os.close(fd)
+    return written
+
+
+def open_upload(session):
+    return SessionFile(open(part_path(session), "rb"), name=session.filename)
+
+
+def discard(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired():
+    """Delete expired sessions; their files go with them (see core/signals.py)."""
+    return UploadSession.objects.filter(expires_at__lte=timezone.now()).delete()[0]
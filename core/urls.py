@@ -1,9 +1,13 @@
+from django.conf import settings
 from rest_framework.routers import DefaultRouter
 from .views import (
     CustomUserViewSet,
     PostViewSet,
     FeedAPIView,
+    ExploreAPIView,
     NotificationViewSet,
+    UploadSessionViewSet,
+    HashtagViewSet,
     AuthViewSet,
 )
 
@@ -12,7 +16,16 @@ router = DefaultRouter()
 router.register(r"users", CustomUserViewSet, basename="user")
 router.register(r"posts", PostViewSet, basename="post")
 router.register(r"feed", FeedAPIView, basename="feed")
+router.register(r"explore", ExploreAPIView, basename="explore")
+router.register(r"tags", HashtagViewSet, basename="tag")
 router.register(r"notifications", NotificationViewSet, basename="notification")
+router.register(r"uploads", UploadSessionViewSet, basename="upload")
 router.register(r"auth", AuthViewSet, basename="auth")
 
 urlpatterns = router.urls
+
+if settings.ASYNC_READ_VIEWS:
+    from . import async_views
+
+    # Same paths as the router's, so they must come first
+    urlpatterns = async_views.urlpatterns + urlpatterns
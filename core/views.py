@@ -1,9 +1,11 @@
 from rest_framework import viewsets, filters, mixins, serializers
 from rest_framework.decorators import action
-from django.db.models import Count
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework.reverse import reverse
 from rest_framework_simplejwt.serializers import (
@@ -15,7 +17,18 @@ from rest_framework.permissions import (
     IsAuthenticatedOrReadOnly,
     AllowAny,
 )
-from .models import CustomUser, Post, Comment, Notification
+from .models import (
+    CustomUser,
+    Post,
+    Comment,
+    Notification,
+    TimelineEntry,
+    UploadSession,
+    Hashtag,
+    PostHashtag,
+    FollowSuggestion,
+    PostLike,
+)
 from .serializers import (
     CommentSerializer,
     CustomUserListSerializer,
@@ -25,13 +38,37 @@ from .serializers import (
     NotificationSerializer,
     RegisterSerializer,
     ChangePasswordSerializer,
+    MarkReadSerializer,
+    UploadSessionSerializer,
+    UploadFinalizeSerializer,
+    UserAutocompleteSerializer,
+    HashtagSerializer,
+    FollowSuggestionSerializer,
+    RelationshipsQuerySerializer,
+    RelationshipSerializer,
+)
+from .pagination import (
+    CursorPagination,
+    IdKeysetPagination,
+    KeysetPagination,
+    NotificationSincePagination,
 )
+from .authentication import issue_stream_ticket
+from .db_router import use_primary
+from .relations import get_viewer_relations
+from .likes import toggle_like
+from . import explore, notifications, profile_cache, search, uploads
 
 User = get_user_model()
 
 
 """Profiller ham baylanislar"""
 
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 20
+AUTOCOMPLETE_MAX_QUERY = 30
+SUGGESTIONS_LIMIT = 30
+
 
 class CustomUserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser
@@ -40,21 +77,98 @@ class CustomUserViewSet(viewsets.ModelViewSet):
     search_fields = ["username", "first_name"]
 
     def get_queryset(self):
-        queryset = CustomUser.objects.all()
-
-        if self.action == "retrieve":
-            queryset = queryset.annotate(
-                posts_count=Count("posts", distinct=True),
-                followers_count=Count("followers", distinct=True),
-                following_count=Count("following", distinct=True),
-            )
-        return queryset
+        # posts_count / followers_count / following_count are stored columns
+        return CustomUser.objects.all()
 
     def get_serializer_class(self):
         if self.action == "retrieve":
             return CustomUserDetailSerializer
         return CustomUserListSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        # Payload cached per version stamp (core/profile_cache.py); is_following
+        # depends on the viewer, so it is filled in per request.
+        try:
+            user_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+
+        host = request.get_host()
+        data, version = profile_cache.get_payload(user_id, host)
+        if data is None:
+            # Cached until the next change: never fill it from a lagging replica
+            use_primary()
+            data = super().retrieve(request, *args, **kwargs).data
+            profile_cache.set_payload(user_id, version, host, data)
+
+        relations = get_viewer_relations({"request": request})
+        data = {**data, "is_following": relations.is_following(CustomUser(id=user_id))}
+        return Response(data)
+
+    # Autocomplete (?q=, ?limit=)
+    @action(detail=False, methods=["get"], pagination_class=None)
+    def autocomplete(self, request):
+        query = request.query_params.get("q", "")[:AUTOCOMPLETE_MAX_QUERY]
+        try:
+            limit = int(request.query_params.get("limit", AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            limit = AUTOCOMPLETE_LIMIT
+        limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+
+        users = search.autocomplete(query, limit)
+        serializer = UserAutocompleteSerializer(
+            users, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    # Suggested for you (compute_follow_suggestions)
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        pagination_class=None,
+    )
+    def suggestions(self, request):
+        # Drop people followed since the last batch run
+        followed = CustomUser.followers.through.objects.filter(
+            to_customuser_id=request.user.id
+        ).values("from_customuser_id")
+        suggestions = (
+            FollowSuggestion.objects.filter(user=request.user)
+            .exclude(suggested_id__in=followed)
+            .select_related("suggested")
+            .order_by("-score")[:SUGGESTIONS_LIMIT]
+        )
+        serializer = FollowSuggestionSerializer(
+            suggestions, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    # Relationships (?ids=1,2,3)
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        pagination_class=None,
+    )
+    def relationships(self, request):
+        query = RelationshipsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        ids = query.validated_data["ids"]
+
+        relations = get_viewer_relations({"request": request})
+        relations.load_following(ids)
+        relations.load_followed_by(ids)
+        data = [
+            {
+                "id": pk,
+                "following": relations.is_following(CustomUser(id=pk)),
+                "followed_by": relations.is_followed_by(CustomUser(id=pk)),
+            }
+            for pk in ids
+        ]
+        return Response(RelationshipSerializer(data, many=True).data)
+
     # Follow
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated])
     def follow(self, request, pk=None):
@@ -89,72 +203,94 @@ class CustomUserViewSet(viewsets.ModelViewSet):
 
         return Response({"status": "Siz bul adamga follow bolmagansiz"})
 
-    # Followers
-    @action(detail=True, methods=["get"])
-    def followers(self, request, pk=None):
-        user = self.get_object()
-        followers_list = user.followers.all()
+    def follow_list(self, follows, field):
+        """
+        Users on the ``field`` side of the follow rows, most recent follow
+        first. The through table has no timestamp, so "recent" is its row id,
+        and ``?pagination=cursor`` pages on it (IdKeysetPagination).
+        """
+        follows = follows.select_related(field).order_by("-id")
 
-        page = self.paginate_queryset(followers_list)
+        page = self.paginate_queryset(follows)
         if page is not None:
-            serializer = CustomUserListSerializer(page, many=True)
+            serializer = CustomUserListSerializer(
+                [getattr(follow, field) for follow in page], many=True
+            )
             return self.get_paginated_response(serializer.data)
 
-        serializer = CustomUserDetailSerializer(followers_list, many=True)
+        serializer = CustomUserDetailSerializer(
+            [getattr(follow, field) for follow in follows],
+            many=True,
+            context=self.get_serializer_context(),
+        )
         return Response(serializer.data)
 
+    # Followers
+    @action(detail=True, methods=["get"], pagination_class=IdKeysetPagination)
+    def followers(self, request, pk=None):
+        user = self.get_object()
+        Follow = CustomUser.followers.through
+        return self.follow_list(
+            Follow.objects.filter(from_customuser=user), "to_customuser"
+        )
+
     # Following
-    @action(detail=True, methods=["get"])
+    @action(detail=True, methods=["get"], pagination_class=IdKeysetPagination)
     def following(self, request, pk=None):
         user = self.get_object()
-        following_list = user.following.all()
-
-        page = self.paginate_queryset(following_list)
-        if page is not None:
-            serializer = CustomUserListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = CustomUserDetailSerializer(following_list, many=True)
-        return Response(serializer.data)
+        Follow = CustomUser.followers.through
+        return self.follow_list(
+            Follow.objects.filter(to_customuser=user), "from_customuser"
+        )
 
 
 """Postlar + Reakciyalar"""
 
 
 class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all().order_by("-created_at")
+    queryset = Post.objects.select_related("author").order_by("-created_at", "-id")
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
+    # Posts, likes and comments lists: ?pagination=cursor for keyset pages
+    pagination_class = KeysetPagination
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        # post_save writes the outbox event, keep it in the same transaction
+        with transaction.atomic():
+            serializer.save(author=self.request.user)
 
     # Like basiw
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated])
     def like(self, request, pk=None):
         post = self.get_object()
-        user = request.user
-
-        if post.likes.filter(id=user.id).exists():
-            post.likes.remove(user)
-            return Response({"status": "Unliked", "likes_count": post.likes.count()})
-        else:
-            post.likes.add(user)
-
-        return Response({"status": "liked", "likes_count": post.likes.count()})
+        liked, likes_count = toggle_like(post.pk, request.user.id)
+        return Response(
+            {"status": "liked" if liked else "Unliked", "likes_count": likes_count}
+        )
 
     # Like basqanlar dizimi
     @action(detail=True, methods=["get"])
     def likes(self, request, pk=None):
         post = self.get_object()
-        users = post.likes.all()
+        # Newest likers first, keyset-ready on (post, -created_at, -id)
+        post_likes = (
+            PostLike.objects.filter(post=post)
+            .select_related("user")
+            .order_by("-created_at", "-id")
+        )
 
-        page = self.paginate_queryset(users)
+        page = self.paginate_queryset(post_likes)
         if page is not None:
-            serializer = CustomUserListSerializer(page, many=True)
+            serializer = CustomUserListSerializer(
+                [like.user for like in page], many=True
+            )
             return self.get_paginated_response(serializer.data)
 
-        serializer = CustomUserDetailSerializer(page, many=True)
+        serializer = CustomUserDetailSerializer(
+            [like.user for like in post_likes],
+            many=True,
+            context=self.get_serializer_context(),
+        )
         return Response(serializer.data)
 
     # Comment jaziw
@@ -165,7 +301,8 @@ class PostViewSet(viewsets.ModelViewSet):
         serializer = CommentSerializer(data=request.data)
 
         if serializer.is_valid():
-            serializer.save(user=user, post=post)
+            with transaction.atomic():
+                serializer.save(user=user, post=post)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -174,7 +311,7 @@ class PostViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"])
     def comments(self, request, pk=None):
         post = self.get_object()
-        comments = Comment.objects.filter(post=post).order_by("-created_at")
+        comments = Comment.objects.filter(post=post).order_by("-created_at", "-id")
 
         page = self.paginate_queryset(comments)
         if page is not None:
@@ -185,13 +322,108 @@ class PostViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+"""Resumable upload"""
+
+
+class UploadSessionViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    POST /uploads/ {filename, size} opens a session. Each
+    PUT /uploads/{id}/chunk/ with ``Content-Range: bytes a-b/size`` is streamed
+    to disk at ``a``; GET /uploads/{id}/ gives the offset to resume from after a
+    dropped connection. POST /uploads/{id}/finalize/ {caption} turns the file
+    into a Post. Sessions not finished within UPLOAD_SESSION_TTL are purged.
+    """
+
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(
+            user=self.request.user, expires_at__gt=timezone.now()
+        )
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user, expires_at=uploads.expiry())
+
+    # Chunk juklew
+    @action(detail=True, methods=["put"])
+    def chunk(self, request, pk=None):
+        session = self.get_object()
+        content_range = uploads.parse_content_range(
+            request.headers.get("Content-Range")
+        )
+        length = uploads.parse_content_length(request.META.get("CONTENT_LENGTH"))
+
+        if (
+            content_range is None
+            or length is None
+            or content_range[2] != session.size
+            or content_range[1] > session.size
+            or content_range[1] - content_range[0] != length
+        ):
+            return Response(
+                {"error": "Content-Range jaraqsiz"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+            return Response(
+                {"error": "Chunk dim ulken"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if content_range[0] != session.offset:
+                return Response(
+                    {"error": "Offset saykes emes", "offset": session.offset},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            written = uploads.write_chunk(
+                session, request.stream, content_range[0], length
+            )
+            session.offset += written
+            session.expires_at = uploads.expiry()
+            session.save(update_fields=["offset", "expires_at"])
+
+        data = self.get_serializer(session).data
+        if written < length:
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+    # Postqa aylandiriw
+    @action(detail=True, methods=["post"], serializer_class=UploadFinalizeSerializer)
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        if session.offset != session.size:
+            return Response(
+                {"error": "Fayl toliq juklenbegen", "offset": session.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with uploads.open_upload(session) as image:
+            post_serializer = PostSerializer(
+                data={**serializer.validated_data, "image": image},
+                context=self.get_serializer_context(),
+            )
+            post_serializer.is_valid(raise_exception=True)
+            with transaction.atomic():
+                post_serializer.save(author=request.user)
+                session.delete()
+
+        return Response(post_serializer.data, status=status.HTTP_201_CREATED)
+
+
 """NewsFeed"""
 
 
-class FeedPagination(PageNumberPagination):
+class FeedPagination(KeysetPagination):
     page_size = 10
-    page_size_query_param = "page_size"
-    max_page_size = 50
 
 
 # generics.ListAPIView ornina mixins.ListModelMixin,viewsets.GenericViewSet islettim.urls.py da router paydalaniw ushin
@@ -201,19 +433,78 @@ class FeedAPIView(mixins.ListModelMixin, viewsets.GenericViewSet):
     pagination_class = FeedPagination
 
     def get_queryset(self):
-        user = self.request.user
-        following_users = user.following.all()
-        queryset = (
-            Post.objects.filter(author__in=following_users)
-            .select_related("author")
-            .annotate(
-                likes_count=Count("likes", distinct=True),
-                comments_count=Count("comments", distinct=True),
-            )
-            .order_by("-created_at")
+        # Read from the materialized timeline (core/timeline.py), not the follow graph
+        return (
+            TimelineEntry.objects.filter(user=self.request.user)
+            .select_related("post__author")
+            .order_by("-created_at", "-id")
         )
 
-        return queryset
+    def list(self, request, *args, **kwargs):
+        entries = self.paginate_queryset(self.get_queryset())
+        posts = [entry.post for entry in entries]
+
+        serializer = self.get_serializer(posts, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+"""Explore"""
+
+
+class ExplorePagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 50
+
+
+class ExploreAPIView(mixins.ListModelMixin, viewsets.GenericViewSet):
+    serializer_class = FeedPostSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = ExplorePagination
+
+    def get_queryset(self):
+        return Post.objects.select_related("author")
+
+    def list(self, request, *args, **kwargs):
+        # Ranked ids come precomputed from the cache (update_explore_scores)
+        page_ids = self.paginate_queryset(explore.top_ids())
+        posts = self.get_queryset().in_bulk(page_ids)
+        page = [posts[pk] for pk in page_ids if pk in posts]
+
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+"""Hashtags"""
+
+
+class HashtagViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Hashtag.objects.order_by("-posts_count", "id")
+    serializer_class = HashtagSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    lookup_field = "name"
+
+    def get_object(self):
+        # Tags are stored casefolded, so #Python and #python are one page
+        self.kwargs[self.lookup_field] = self.kwargs[self.lookup_field].casefold()
+        return super().get_object()
+
+    # Teg boyinsha postlar
+    @action(detail=True, methods=["get"], pagination_class=CursorPagination)
+    def posts(self, request, name=None):
+        hashtag = self.get_object()
+        entries = (
+            PostHashtag.objects.filter(hashtag=hashtag)
+            .select_related("post__author")
+            .order_by("-created_at", "-id")
+        )
+        page = self.paginate_queryset(entries)
+        serializer = FeedPostSerializer(
+            [entry.post for entry in page],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return self.get_paginated_response(serializer.data)
 
 
 """Notifications"""
@@ -222,12 +513,52 @@ class FeedAPIView(mixins.ListModelMixin, viewsets.GenericViewSet):
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(receiver=self.request.user).order_by(
-            "-created_at"
+        return (
+            Notification.objects.filter(receiver=self.request.user)
+            .select_related("sender", "post")
+            .order_by("-created_at", "-id")
+        )
+
+    # Unread count
+    @action(detail=False, methods=["get"])
+    def unread_count(self, request):
+        return Response({"unread_count": notifications.unread_count(request.user.id)})
+
+    # Mark read (all, or only ids)
+    @action(detail=False, methods=["post"])
+    def mark_read(self, request):
+        serializer = MarkReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        unread = Notification.objects.filter(receiver=request.user, is_read=False)
+        if "ids" in serializer.validated_data:
+            unread = unread.filter(id__in=serializer.validated_data["ids"])
+        updated = unread.update(is_read=True)
+        notifications.forget_unread([request.user.id])
+        return Response({"updated": updated})
+
+    # Ticket for the SSE stream (core/async_views.py), which EventSource opens
+    # without an Authorization header
+    @action(detail=False, methods=["post"], url_path="stream-ticket")
+    def stream_ticket(self, request):
+        return Response(
+            {
+                "ticket": issue_stream_ticket(request.auth),
+                "expires_in": settings.STREAM_TICKET_TTL,
+            }
         )
 
+    # Delta sync
+    @action(detail=False, methods=["get"])
+    def since(self, request):
+        paginator = NotificationSincePagination()
+        page = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
 
 """#Register Login """
 
@@ -0,0 +1,25 @@
+import os
+import shutil
+
+bind = "0.0.0.0:8000"
+
+# core/metrics.py: each worker keeps its samples in this directory and
+# /metrics sums them. prometheus_client reads it once, at import time, so it
+# is set here before anything imports the library.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc"
+)
+
+
+def on_starting(server):
+    # Files left by a previous run would be counted again
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+    # Load it now rather than for the first time inside the SIGCHLD handler
+    import prometheus_client.multiprocess  # noqa: F401
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)